@@ -1,3 +1,87 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+from .models import UserProfile, MenstrualCycle, FlowIntensityLog, MenstrualCycleHistory, Prediction
 
-# Register your models here.
+
+# Paginator that never runs an unbounded COUNT(*) over large tables
+class EstimatedCountPaginator(Paginator):
+    """
+    On PostgreSQL, unfiltered changelists use the planner's row estimate. Everything else,
+    filtered changelists and every changelist on other backends, counts at most
+    EXACT_COUNT_LIMIT + 1 rows, so pages past that limit are not linked (narrow the filter
+    or the date hierarchy to reach them).
+    """
+
+    EXACT_COUNT_LIMIT = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            estimate = self.table_estimate(queryset)
+            if estimate is not None and estimate > self.EXACT_COUNT_LIMIT:
+                return estimate
+        # Counts a LIMITed subquery, so the cost is bounded however many rows match
+        return queryset.order_by()[:self.EXACT_COUNT_LIMIT + 1].count()
+
+    @staticmethod
+    def table_estimate(queryset):
+        """Row estimate from PostgreSQL's statistics for unfiltered querysets, None otherwise."""
+        connection = connections[queryset.db]
+        if queryset.query.where:
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        return row[0] if row and row[0] >= 0 else None
+
+
+# date_hierarchy fields need an index leading with the date, see the models, or its MIN/MAX
+# and dates() queries scan the whole table
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False  # Skip the second, unfiltered count on filtered pages
+    list_select_related = ['user']  # __str__ of every model reads user.username
+    raw_id_fields = ['user']
+    search_fields = ['=user__username']  # Exact match uses the unique username index
+    list_per_page = 50
+
+
+@admin.register(UserProfile)
+class UserProfileAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'cycle_state', 'menstruation_status', 'next_menstruation_start', 'safe_sex_zone']
+    list_filter = ['cycle_state', 'safe_sex_zone']
+
+
+@admin.register(MenstrualCycle)
+class MenstrualCycleAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'menstruation_start', 'menstruation_end', 'cycle_length', 'ovulation_date']
+    date_hierarchy = 'menstruation_start'
+
+
+@admin.register(FlowIntensityLog)
+class FlowIntensityLogAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'cycle_id', 'date', 'intensity']
+    list_filter = ['intensity']
+    raw_id_fields = ['user', 'cycle']
+    date_hierarchy = 'date'
+
+
+@admin.register(MenstrualCycleHistory)
+class MenstrualCycleHistoryAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'start_date', 'end_date', 'cycle_length']
+    raw_id_fields = ['user', 'related_cycle', 'flow_logs']
+    date_hierarchy = 'start_date'
+
+
+@admin.register(Prediction)
+class PredictionAdmin(LargeTableAdmin):
+    list_display = ['id', 'user', 'menstrual_cycle_id', 'next_period_prediction', 'ovulation_prediction',
+                    'ovulation_prediction_accuracy']
+    raw_id_fields = ['user', 'menstrual_cycle']
+    date_hierarchy = 'next_period_prediction'
@@ -0,0 +1,226 @@
+"""
+Population analytics kept as pre-aggregated histograms.
+
+AnalyticsBucket holds one count per (metric, age group, value). Each user's
+share of those counts is stored in AnalyticsContribution, so a periodic delta
+batch only has to look at users whose cycles, profile or predictions changed
+since the last run (found through the ``updated_at`` indexes and tombstones),
+recompute their contribution and apply the difference. Dashboards read the
+small bucket table and never touch the per-user tables. Every chunk of users is
+committed in its own short transaction.
+
+Age groups are derived when a user is processed, users whose data does not
+change keep their group until the next full rebuild.
+"""
+from collections import Counter, defaultdict
+from datetime import date, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+from .models import (
+    AnalyticsBucket, AnalyticsContribution, AnalyticsState, MenstrualCycle, Prediction, Tombstone, UserProfile
+)
+
+STATE_KEY = 'histograms'
+METRICS = ['cycle_length', 'menstruation_duration', 'cycle_state', 'prediction_accuracy']
+AGE_GROUPS = [(18, '<18'), (25, '18-24'), (30, '25-29'), (35, '30-34'), (40, '35-39'), (45, '40-44')]
+OLDEST_AGE_GROUP, UNKNOWN_AGE_GROUP = '45+', 'unknown'
+MAX_CYCLE_LENGTH = 60  # Longer gaps between periods are counted in the "60" bucket
+MAX_DURATION = 15
+ACCURACY_STEP = 5  # Prediction accuracy bucket width in percent
+RUN_LEASE = timedelta(minutes=30)  # A run that stopped renewing its lease this long ago is presumed dead
+
+
+def age_group(birthdate, today):
+    if birthdate is None:
+        return UNKNOWN_AGE_GROUP
+    age = today.year - birthdate.year - ((today.month, today.day) < (birthdate.month, birthdate.day))
+    for limit, label in AGE_GROUPS:
+        if age < limit:
+            return label
+    return OLDEST_AGE_GROUP
+
+
+def compute_contributions(user_ids, today=None):
+    """Return {user_id: (age_group, histogram)} for the given users, with one query per table."""
+    today = today or date.today()
+    profiles = {
+        user_id: (birthdate, cycle_state)
+        for user_id, birthdate, cycle_state in UserProfile.objects.filter(user_id__in=user_ids)
+        .values_list('user_id', 'birthdate', 'cycle_state')
+    }
+    histograms = defaultdict(lambda: {metric: Counter() for metric in METRICS})
+
+    previous_user, previous_start = None, None
+    for user_id, start, duration in (
+        MenstrualCycle.objects.filter(user_id__in=user_ids)
+        .order_by('user_id', 'menstruation_start').values_list('user_id', 'menstruation_start', 'menstruation_duration')
+    ):
+        histogram = histograms[user_id]
+        if duration is not None:
+            histogram['menstruation_duration'][str(min(duration, MAX_DURATION))] += 1
+        if user_id == previous_user:
+            histogram['cycle_length'][str(min((start - previous_start).days, MAX_CYCLE_LENGTH))] += 1
+        previous_user, previous_start = user_id, start
+
+    seen = set()
+    for user_id, accuracy in (
+        Prediction.objects.filter(user_id__in=user_ids)
+        .order_by('user_id', '-id').values_list('user_id', 'ovulation_prediction_accuracy')
+    ):
+        if user_id not in seen:  # Latest prediction only
+            seen.add(user_id)
+            histograms[user_id]['prediction_accuracy'][str(accuracy // ACCURACY_STEP * ACCURACY_STEP)] += 1
+
+    for user_id, (_, cycle_state) in profiles.items():
+        histograms[user_id]['cycle_state'][cycle_state] += 1
+
+    return {
+        user_id: (
+            age_group(profiles.get(user_id, (None, None))[0], today),
+            {metric: dict(counts) for metric, counts in histogram.items() if counts},
+        )
+        for user_id, histogram in histograms.items()
+    }
+
+
+def apply_contributions(user_ids, today=None, batch_size=1000):
+    """
+    Recompute the contributions of ``user_ids`` and apply the differences to the buckets.
+    Returns the number of these users that contribute to the histograms.
+    """
+    new = compute_contributions(user_ids, today)
+    old = {
+        contribution.user_id: contribution
+        for contribution in AnalyticsContribution.objects.filter(user_id__in=user_ids)
+    }
+
+    delta = Counter()
+    for contribution in old.values():
+        for metric, counts in contribution.histogram.items():
+            for value, count in counts.items():
+                delta[(metric, contribution.age_group, value)] -= count
+    for group, histogram in new.values():
+        for metric, counts in histogram.items():
+            for value, count in counts.items():
+                delta[(metric, group, value)] += count
+
+    changed = {key: change for key, change in delta.items() if change}
+    if changed:
+        # The bucket table is small, read it whole and write back the new totals
+        buckets = {
+            (bucket.metric, bucket.age_group, bucket.value): bucket
+            for bucket in AnalyticsBucket.objects.all()
+        }
+        updated = []
+        for key, change in changed.items():
+            bucket = buckets.get(key) or AnalyticsBucket(metric=key[0], age_group=key[1], value=key[2])
+            bucket.count += change
+            updated.append(bucket)
+        AnalyticsBucket.objects.bulk_create(
+            updated, batch_size=batch_size,
+            update_conflicts=True, unique_fields=['metric', 'age_group', 'value'], update_fields=['count'],
+        )
+
+    AnalyticsContribution.objects.filter(user_id__in=set(old) - set(new)).delete()
+    AnalyticsContribution.objects.bulk_create(
+        [
+            AnalyticsContribution(user_id=user_id, age_group=group, histogram=histogram)
+            for user_id, (group, histogram) in new.items()
+        ],
+        batch_size=batch_size,
+        update_conflicts=True, unique_fields=['user_id'], update_fields=['age_group', 'histogram'],
+    )
+    return len(new)
+
+
+def changed_user_ids(since, until):
+    """Users with cycle, profile or prediction writes or deletions in (since, until]."""
+    user_ids = set()
+    for model in (MenstrualCycle, UserProfile, Prediction):
+        user_ids.update(
+            model.objects.filter(updated_at__gt=since, updated_at__lte=until).values_list('user_id', flat=True).distinct()
+        )
+    user_ids.update(
+        Tombstone.objects.filter(
+            deleted_at__gt=since, deleted_at__lte=until,
+            model__in=[model._meta.model_name for model in (MenstrualCycle, UserProfile, Prediction)],
+        ).values_list('user_id', flat=True).distinct()
+    )
+    return sorted(user_ids)
+
+
+def delete_in_chunks(queryset, chunk_size):
+    while True:
+        ids = list(queryset.order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not ids:
+            return
+        queryset.model.objects.filter(pk__in=ids).delete()
+
+
+def acquire_run(key, now):
+    """Take the run lease on the state row, returns the state or None while another run holds it."""
+    with transaction.atomic():
+        state, _ = AnalyticsState.objects.select_for_update().get_or_create(key=key)
+        if state.running_since and state.running_since > now - RUN_LEASE:
+            return None
+        state.running_since = now
+        state.save(update_fields=['running_since'])
+    return state
+
+
+def refresh_analytics(rebuild=False, chunk_size=1000, today=None):
+    """
+    Bring the histograms up to date.
+
+    The first run, and every run with ``rebuild``, recomputes everything; later runs
+    only process users changed since the previous run. Each chunk of users commits on its
+    own so live writes are never blocked for long, a lease on the state row keeps runs from
+    overlapping. Returns the number of users with data among the processed ones, or None
+    when another run is in progress.
+    """
+    # Rows younger than this may belong to transactions that have not committed yet
+    until = timezone.now() - timedelta(seconds=settings.MENS1_SYNC_SETTLE_SECONDS)
+    state = acquire_run(STATE_KEY, timezone.now())
+    if state is None:
+        return None
+
+    try:
+        if rebuild or state.processed_until is None:
+            # Until the rebuild completes the histograms are partial, processed_until stays None to say so
+            AnalyticsState.objects.filter(pk=state.pk).update(processed_until=None)
+            AnalyticsBucket.objects.all().delete()
+            delete_in_chunks(AnalyticsContribution.objects.all(), chunk_size)
+            max_id = User.objects.aggregate(max_id=Max('id'))['max_id'] or 0
+            chunks = (range(start, min(start + chunk_size, max_id + 1)) for start in range(1, max_id + 1, chunk_size))
+        else:
+            user_ids = changed_user_ids(state.processed_until, until)
+            chunks = (user_ids[start:start + chunk_size] for start in range(0, len(user_ids), chunk_size))
+
+        processed = 0
+        for chunk in chunks:
+            with transaction.atomic():
+                processed += apply_contributions(list(chunk), today)
+                # Renew the lease so long rebuilds are not taken over
+                AnalyticsState.objects.filter(pk=state.pk).update(running_since=timezone.now())
+
+        AnalyticsState.objects.filter(pk=state.pk).update(processed_until=until)
+    finally:
+        AnalyticsState.objects.filter(pk=state.pk).update(running_since=None)
+    return processed
+
+
+def histogram_report(metric=None, group=None):
+    """Return {metric: {age_group: {value: count}}} read from the bucket table."""
+    buckets = AnalyticsBucket.objects.filter(count__gt=0)
+    if metric:
+        buckets = buckets.filter(metric=metric)
+    if group:
+        buckets = buckets.filter(age_group=group)
+
+    report = defaultdict(lambda: defaultdict(dict))
+    for metric_name, group_name, value, count in buckets.values_list('metric', 'age_group', 'value', 'count'):
+        report[metric_name][group_name][value] = count
+    return {metric_name: dict(groups) for metric_name, groups in report.items()}
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class Mens1Config(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'Mens1'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401  Register system checks and signal handlers
@@ -0,0 +1,149 @@
+"""
+Native async read endpoints for high-concurrency clients, served under /api/async/.
+
+These mirror the read side of the DRF ViewSets with Django's async ORM, so a
+worker running under ASGI can hold many open connections without tying up a
+thread per request. Authentication and throttling use the async variants of
+CachedJWTAuthentication and SlidingWindowUserRateThrottle. Lists are paginated
+by a keyset cursor on the same (user, <date>) indexes as the sync endpoints.
+"""
+from datetime import date
+from functools import wraps
+from django.db.models import Q
+from django.http import HttpResponse
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed, ParseError
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .authentication import CachedJWTAuthentication
+from .fieldsets import requested_fields
+from .models import MenstrualCycle, Prediction, UserProfile
+from .renderers import FastJSONRenderer
+from .serializers import CalendarRangeSerializer, CalendarDaySerializer
+from .throttling import SlidingWindowUserRateThrottle
+from .timeline import build_timeline, cycle_rows, flow_log_rows, prediction_rows
+from .views import MenstrualCycleViewSet, PredictionViewSet, UserProfileViewSet
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+def json_response(data, status_code=status.HTTP_200_OK):
+    return HttpResponse(FastJSONRenderer().render(data), status=status_code, content_type='application/json')
+
+
+def async_api_view(view):
+    """Authenticate and throttle a GET-only async view and render what it returns as JSON."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method != 'GET':
+            return json_response({"detail": f'Method "{request.method}" not allowed.'},
+                                 status.HTTP_405_METHOD_NOT_ALLOWED)
+
+        authenticator = CachedJWTAuthentication()
+        try:
+            result = await authenticator.aauthenticate(request)
+        except (AuthenticationFailed, InvalidToken) as exc:
+            detail = exc.detail if isinstance(exc.detail, dict) else {"detail": exc.detail}
+            return json_response(detail, status.HTTP_401_UNAUTHORIZED)
+        if result is None:
+            return json_response({"detail": "Authentication credentials were not provided."},
+                                 status.HTTP_401_UNAUTHORIZED)
+        request.user = result[0]
+
+        throttle = SlidingWindowUserRateThrottle()
+        if not await throttle.aallow_request(request, None):
+            response = json_response({"detail": "Request was throttled."}, status.HTTP_429_TOO_MANY_REQUESTS)
+            response['Retry-After'] = str(int(throttle.wait() or 0) + 1)
+            return response
+
+        try:
+            data, status_code = await view(request, *args, **kwargs)
+        except ParseError as exc:
+            return json_response({"detail": exc.detail}, status.HTTP_400_BAD_REQUEST)
+        return json_response(data, status_code)
+
+    return wrapper
+
+
+def select_fields(request, fast_fields):
+    """Map the fields requested through ?fields= / ?exclude= to their .values() lookups."""
+    return {name: fast_fields[name] for name in requested_fields(request, fast_fields)}
+
+
+async def keyset_page(request, queryset, fields, date_field=None):
+    """Return one page of rows ordered newest first, continuing after the ?cursor= position."""
+    try:
+        page_size = min(max(int(request.GET.get('page_size', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    except ValueError:
+        page_size = DEFAULT_PAGE_SIZE
+
+    cursor = request.GET.get('cursor')
+    if cursor:
+        try:
+            if date_field:
+                cursor_date, _, cursor_id = cursor.partition(':')
+                cursor_date, cursor_id = date.fromisoformat(cursor_date), int(cursor_id)
+            else:
+                cursor_id = int(cursor)
+        except ValueError:
+            raise ParseError("Invalid cursor.")
+        if date_field:
+            queryset = queryset.filter(
+                Q(**{f'{date_field}__lt': cursor_date}) | Q(**{date_field: cursor_date, 'id__lt': cursor_id})
+            )
+        else:
+            queryset = queryset.filter(id__lt=cursor_id)
+
+    ordering = [f'-{date_field}', '-id'] if date_field else ['-id']
+    columns = set(fields.values()) | {'id'} | ({date_field} if date_field else set())
+    rows = [row async for row in queryset.order_by(*ordering).values(*columns)[:page_size + 1]]
+
+    next_link = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        last = rows[-1]
+        position = f"{last[date_field].isoformat()}:{last['id']}" if date_field else str(last['id'])
+        params = request.GET.copy()
+        params['cursor'] = position
+        next_link = request.build_absolute_uri(f'{request.path}?{params.urlencode()}')
+
+    results = [{name: row[lookup] for name, lookup in fields.items()} for row in rows]
+    return {"next": next_link, "results": results}
+
+
+@async_api_view
+async def menstrual_cycles(request):
+    fields = select_fields(request, MenstrualCycleViewSet.fast_fields)
+    queryset = MenstrualCycle.objects.filter(user=request.user)
+    return await keyset_page(request, queryset, fields, date_field='menstruation_start'), status.HTTP_200_OK
+
+
+@async_api_view
+async def predictions(request):
+    fields = select_fields(request, PredictionViewSet.fast_fields)
+    queryset = Prediction.objects.filter(user=request.user)
+    return await keyset_page(request, queryset, fields), status.HTTP_200_OK
+
+
+@async_api_view
+async def user_profile(request):
+    fields = select_fields(request, UserProfileViewSet.fast_fields)
+    profile = await UserProfile.objects.filter(user=request.user).values(*set(fields.values())).afirst()
+    if profile is None:
+        return {"detail": "No profile found."}, status.HTTP_404_NOT_FOUND
+    return {name: profile[lookup] for name, lookup in fields.items()}, status.HTTP_200_OK
+
+
+@async_api_view
+async def calendar(request):
+    serializer = CalendarRangeSerializer(data=request.GET)
+    if not serializer.is_valid():
+        return serializer.errors, status.HTTP_400_BAD_REQUEST
+
+    start, end = serializer.validated_data['start'], serializer.validated_data['end']
+    cycles = [row async for row in cycle_rows(request.user, start, end)]
+    flow_logs = [row async for row in flow_log_rows(request.user, start, end)]
+    predicted = [row async for row in prediction_rows(request.user, start, end)]
+    days = build_timeline(start, end, cycles, flow_logs, predicted)
+    return {"start": start, "end": end, "days": CalendarDaySerializer(days, many=True).data}, status.HTTP_200_OK
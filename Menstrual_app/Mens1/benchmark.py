@@ -0,0 +1,189 @@
+"""
+Concurrent benchmark harness for the API.
+
+Logs in a sample of (synthetic) users through the JWT token endpoint, then
+drives every scenario with a pool of worker threads and records the latency
+and status of each request. Requests go either to a running server over HTTP
+or, without a base URL, through the Django test client in-process. Results are
+plain dicts so they can be dumped as JSON and compared against a baseline.
+"""
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from urllib.parse import urlencode
+import numpy as np
+from django.db import close_old_connections
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from .synthetic import DEFAULT_PASSWORD
+
+# name, method, URL name, authenticated
+SCENARIOS = [
+    ('token-obtain', 'POST', 'token_obtain_pair', False),
+    ('token-refresh', 'POST', 'token_refresh', False),
+    ('user-profile-list', 'GET', 'user-profile-list', True),
+    ('menstrual-cycle-list', 'GET', 'menstrual-cycle-list', True),
+    ('menstrual-cycle-history-list', 'GET', 'menstrual-cycle-history-list', True),
+    ('flow-intensity-log-list', 'GET', 'flow-intensity-log-list', True),
+    ('prediction-list', 'GET', 'prediction-list', True),
+    ('calendar', 'GET', 'calendar', True),
+    ('async-menstrual-cycle-list', 'GET', 'async-menstrual-cycle-list', True),
+    ('async-prediction-list', 'GET', 'async-prediction-list', True),
+    ('async-user-profile', 'GET', 'async-user-profile', True),
+    ('async-calendar', 'GET', 'async-calendar', True),
+]
+PERCENTILES = (50, 95, 99)
+CALENDAR_DAYS = 90  # Range requested from the calendar endpoints, ending today
+
+
+def scenario_path(url_name):
+    """Return the request path of a scenario, with the query string the endpoint requires."""
+    path = reverse(url_name)
+    if url_name in ('calendar', 'async-calendar'):
+        end = timezone.now().date()
+        path += '?' + urlencode({'start': end - timedelta(days=CALENDAR_DAYS - 1), 'end': end})
+    return path
+
+
+class HTTPTransport:
+    """Send requests to a running server."""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Accept': 'application/json'}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode()
+            headers['Content-Type'] = 'application/json'
+        if token:
+            headers['Authorization'] = f"Bearer {token}"
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as exc:
+            return exc.code, exc.read()
+
+
+class ClientTransport:
+    """Send requests through the Django test client, in this process."""
+
+    def __init__(self, host='testserver'):
+        self.host = host  # Must be in ALLOWED_HOSTS
+
+    def request(self, method, path, body=None, token=None):
+        headers = {'Authorization': f"Bearer {token}"} if token else {}
+        client = Client(SERVER_NAME=self.host)
+        if method == 'POST':
+            response = client.post(path, body or {}, content_type='application/json', headers=headers)
+        else:
+            response = client.get(path, headers=headers)
+        body = b''.join(response) if response.streaming else response.content
+        if threading.current_thread() is not threading.main_thread():
+            close_old_connections()  # Worker threads each hold their own connection, release it like a request would
+        return response.status_code, body
+
+
+def summarize(latencies, statuses, elapsed):
+    """Return throughput and latency percentiles (in milliseconds) for one scenario."""
+    latencies_ms = np.array(latencies, dtype=np.float64) * 1000
+    percentiles = np.percentile(latencies_ms, PERCENTILES) if len(latencies_ms) else [0.0] * len(PERCENTILES)
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'status_counts': {str(status): count for status, count in sorted(statuses.items())},
+        'elapsed_seconds': round(elapsed, 4),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'latency_ms': {
+            'mean': round(float(latencies_ms.mean()), 3) if len(latencies_ms) else 0.0,
+            **{f"p{p}": round(float(value), 3) for p, value in zip(PERCENTILES, percentiles)},
+            'max': round(float(latencies_ms.max()), 3) if len(latencies_ms) else 0.0,
+        },
+    }
+
+
+def obtain_tokens(transport, usernames, password=DEFAULT_PASSWORD):
+    """Log the users in and return a list of {'access', 'refresh'} token pairs."""
+    path = reverse('token_obtain_pair')
+    tokens = []
+    for username in usernames:
+        status, body = transport.request('POST', path, {'username': username, 'password': password})
+        if status == 200:
+            tokens.append(json.loads(body))
+    return tokens
+
+
+def run_scenario(transport, method, path, jobs, concurrency):
+    """Send every (body, token) job with ``concurrency`` threads. Returns the scenario summary."""
+    def send(job):
+        body, token = job
+        started = time.perf_counter()
+        status, _ = transport.request(method, path, body, token)
+        return time.perf_counter() - started, status
+
+    started = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(send, jobs))
+    else:
+        results = [send(job) for job in jobs]
+    elapsed = time.perf_counter() - started
+    return summarize([latency for latency, _ in results], Counter(status for _, status in results), elapsed)
+
+
+def run_benchmark(transport, usernames, requests=200, concurrency=8, warmup=10, scenarios=None,
+                  password=DEFAULT_PASSWORD, seed=0):
+    """Run the selected scenarios (all by default) and return the report as a dict."""
+    rng = random.Random(seed)
+    tokens = obtain_tokens(transport, usernames, password)
+    if not tokens:
+        raise ValueError("No user could log in, generate synthetic data first.")
+
+    report = {
+        'meta': {
+            'users': len(tokens), 'requests': requests, 'concurrency': concurrency,
+            'warmup': warmup, 'transport': type(transport).__name__,
+        },
+        'endpoints': {},
+    }
+    for name, method, url_name, authenticated in SCENARIOS:
+        if scenarios and name not in scenarios:
+            continue
+        path = scenario_path(url_name)
+
+        def job():
+            pair = rng.choice(tokens)
+            if url_name == 'token_obtain_pair':
+                return {'username': rng.choice(usernames), 'password': password}, None
+            if url_name == 'token_refresh':
+                return {'refresh': pair['refresh']}, None
+            return None, pair['access'] if authenticated else None
+
+        run_scenario(transport, method, path, [job() for _ in range(warmup)], concurrency)
+        report['endpoints'][name] = run_scenario(
+            transport, method, path, [job() for _ in range(requests)], concurrency
+        )
+    return report
+
+
+def find_regressions(report, baseline, tolerance=0.2, metric='p95'):
+    """Return messages for endpoints whose latency ``metric`` grew by more than ``tolerance`` over the baseline."""
+    regressions = []
+    for name, result in report['endpoints'].items():
+        previous = baseline.get('endpoints', {}).get(name)
+        if not previous:
+            continue
+        before, after = previous['latency_ms'][metric], result['latency_ms'][metric]
+        if before and after > before * (1 + tolerance):
+            regressions.append(f"{name}: {metric} {before:.1f}ms -> {after:.1f}ms")
+    return regressions
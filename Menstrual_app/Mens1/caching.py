@@ -0,0 +1,94 @@
+"""
+Per-user response cache for the Mens1 read endpoints.
+
+Every user has a data version that is replaced whenever one of their rows is
+written (see signals.py), once the write's transaction has committed. Cached payloads and ETags are derived from that
+version, so a write invalidates everything cached for the user at once and
+never touches other users' entries.
+"""
+import hashlib
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control
+from django.utils.http import http_date, parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+
+
+def get_cache():
+    return caches[settings.MENS1_CACHE_ALIAS]
+
+
+def _version_key(user_id):
+    return f'mens1:data-version:{user_id}'
+
+
+def get_user_version(user_id):
+    """Return ``(version, last_modified)`` for the user's data."""
+    cache = get_cache()
+    value = cache.get(_version_key(user_id))
+    if value is None:
+        # Unknown or evicted version: start a fresh one, which cannot match any older cache entry
+        cache.add(_version_key(user_id), (uuid.uuid4().hex, time.time()), timeout=None)
+        value = cache.get(_version_key(user_id))
+    return value
+
+
+def _set_user_versions(user_ids):
+    now = time.time()
+    get_cache().set_many(
+        {_version_key(user_id): (uuid.uuid4().hex, now) for user_id in user_ids}, timeout=None
+    )
+
+
+def bump_user_version(*user_ids):
+    """
+    Invalidate everything cached for the given users when the current transaction commits.
+
+    Bumping earlier would let a concurrent read cache the rows from before the commit
+    under the new version, where they would be served until the next write.
+    """
+    user_ids = set(user_ids)
+    transaction.on_commit(lambda: _set_user_versions(user_ids))
+
+
+class CachedResponseMixin:
+    """
+    ViewSet mixin serving ``list`` and ``retrieve`` from the per-user cache.
+
+    Responses carry ETag and Last-Modified headers, and a matching If-None-Match
+    is answered with 304 before any query or serialization happens.
+    """
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(super().retrieve, request, *args, **kwargs)
+
+    def cached_response(self, view_method, request, *args, **kwargs):
+        version, last_modified = get_user_version(request.user.pk)
+        digest = hashlib.md5(f'{version}:{request.get_full_path()}'.encode()).hexdigest()
+        etag = quote_etag(digest)
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            cache = get_cache()
+            cache_key = f'mens1:response:{request.user.pk}:{digest}'
+            data = cache.get(cache_key)
+            if data is None:
+                response = view_method(request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                cache.set(cache_key, response.data, timeout=settings.MENS1_CACHE_TIMEOUT)
+            else:
+                response = Response(data)
+
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+
+@register(Tags.caches)
+def check_throttle_store(app_configs, **kwargs):
+    """The cache throttle store is only shared between workers when its cache is."""
+    if settings.MENS1_THROTTLE_STORE != 'cache':
+        return []
+    backend = settings.CACHES.get(settings.MENS1_THROTTLE_CACHE_ALIAS, {}).get('BACKEND', '')
+    if backend == 'django.core.cache.backends.locmem.LocMemCache':
+        return [Warning(
+            f"MENS1_THROTTLE_CACHE_ALIAS '{settings.MENS1_THROTTLE_CACHE_ALIAS}' is a per-process locmem cache, "
+            "every worker process allows the full throttle rate.",
+            hint="Set REDIS_URL, point MENS1_THROTTLE_CACHE_ALIAS at a shared cache or use MENS1_THROTTLE_STORE=database.",
+            id='Mens1.W001',
+        )]
+    return []
@@ -0,0 +1,102 @@
+"""
+Streaming exports of a user's data, or of whole tables.
+
+Rows are read with ``values_list().iterator(chunk_size=...)``, which uses a
+server-side cursor where the database supports it, and are encoded as CSV or
+NDJSON one line at a time. Lines are grouped into chunks of roughly
+CHUNK_BYTES (optionally gzip-compressed) so memory use does not depend on the
+number of exported rows.
+"""
+import csv
+import io
+import json
+import zlib
+from .models import FlowIntensityLog, MenstrualCycle, MenstrualCycleHistory, Prediction
+
+try:
+    import orjson
+except ImportError:  # orjson is optional, fall back to the stdlib encoder
+    orjson = None
+
+ITERATOR_CHUNK_SIZE = 2000  # Rows fetched per database round trip
+CHUNK_BYTES = 64 * 1024  # Approximate size of each yielded chunk
+
+DATASETS = {
+    'cycles': (MenstrualCycle, [
+        'id', 'user_id', 'menstruation_start', 'menstruation_end', 'menstruation_duration', 'cycle_length',
+        'cycle_start', 'cycle_end', 'ovulation_date', 'ovulation_window_start', 'ovulation_window_end',
+    ]),
+    'flow-logs': (FlowIntensityLog, ['id', 'user_id', 'cycle_id', 'date', 'intensity']),
+    'history': (MenstrualCycleHistory, [
+        'id', 'user_id', 'related_cycle_id', 'start_date', 'end_date', 'cycle_length', 'symptoms',
+    ]),
+    'predictions': (Prediction, [
+        'id', 'user_id', 'menstrual_cycle_id', 'next_period_prediction', 'ovulation_prediction',
+        'ovulation_prediction_accuracy',
+    ]),
+}
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def export_rows(dataset, user_id=None, chunk_size=ITERATOR_CHUNK_SIZE, using=None):
+    """Return the field names of ``dataset`` and an iterator over its rows in primary key order."""
+    model, fields = DATASETS[dataset]
+    queryset = model.objects.using(using)
+    if user_id is not None:
+        queryset = queryset.filter(user_id=user_id)
+    return fields, queryset.order_by('id').values_list(*fields).iterator(chunk_size=chunk_size)
+
+
+def csv_lines(fields, rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_lines(fields, rows):
+    for row in rows:
+        record = dict(zip(fields, row))
+        if orjson is not None:
+            yield orjson.dumps(record, option=orjson.OPT_APPEND_NEWLINE)
+        else:
+            yield (json.dumps(record, default=str) + '\n').encode()
+
+
+def chunked(lines, size=CHUNK_BYTES):
+    """Group encoded lines into chunks of about ``size`` bytes."""
+    chunk, length = [], 0
+    for line in lines:
+        chunk.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(chunk)
+            chunk, length = [], 0
+    if chunk:
+        yield b''.join(chunk)
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(wbits=31)  # 31 selects the gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def stream_export(dataset, fmt='csv', user_id=None, compress=False, using=None):
+    """Yield the encoded export of ``dataset`` in chunks of bytes."""
+    fields, rows = export_rows(dataset, user_id, using=using)
+    lines = csv_lines(fields, rows) if fmt == 'csv' else ndjson_lines(fields, rows)
+    chunks = chunked(lines)
+    return gzipped(chunks) if compress else chunks
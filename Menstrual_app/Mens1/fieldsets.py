@@ -0,0 +1,100 @@
+"""
+Sparse fieldsets for the Mens1 API.
+
+``?fields=a,b`` limits a response to the listed fields and ``?exclude=c`` drops
+fields. The serializer mixin trims the output, the ViewSet mixin trims the SQL
+with ``.only()`` and offers a ``?fast=1`` list path that builds rows straight
+from ``.values()`` without going through serializer fields.
+"""
+from rest_framework import serializers
+from rest_framework.response import Response
+
+
+def _param_set(request, name):
+    params = getattr(request, 'query_params', request.GET)  # DRF or plain Django request
+    value = params.get(name, '')
+    return {field.strip() for field in value.split(',') if field.strip()}
+
+
+def requested_fields(request, available):
+    """Return the subset of ``available`` field names selected by the request's query parameters."""
+    if request is None or request.method != 'GET':
+        return list(available)
+    fields, exclude = _param_set(request, 'fields'), _param_set(request, 'exclude')
+    return [name for name in available if (not fields or name in fields) and name not in exclude]
+
+
+def is_truthy(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+class SparseFieldsetSerializerMixin:
+    """Drop serializer fields not requested through ``?fields=`` / ``?exclude=``."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        keep = set(requested_fields(self.context.get('request'), self.fields))
+        for name in list(self.fields):
+            if name not in keep:
+                self.fields.pop(name)
+
+
+class SparseFieldsetViewMixin:
+    """
+    ViewSet mixin that loads only the columns the requested fields need.
+
+    ``fast_fields`` maps output names to ``.values()`` lookups; when it is set,
+    ``?fast=1`` serves the list directly from those values.
+    """
+    fast_fields = None
+
+    def requested_field_names(self):
+        return requested_fields(self.request, self.get_serializer_class()().fields)
+
+    def ordering_columns(self):
+        if self.paginator is None:
+            return []
+        return [name.lstrip('-') for name in self.paginator.get_ordering(self.request, None, self)]
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        if self.request.method != 'GET':
+            return queryset
+
+        serializer_fields = self.get_serializer_class()().fields
+        model_fields = {field.name: field for field in queryset.model._meta.concrete_fields}
+        only, related, prefetch = [], [], []
+        for name in self.requested_field_names():
+            field = serializer_fields[name]
+            if field.source in model_fields:
+                only.append(field.source)
+                if isinstance(field, serializers.SlugRelatedField):
+                    # Slugs are read from the joined row, keep the join only when the field is rendered
+                    only.append(f'{field.source}__{field.slug_field}')
+                    related.append(field.source)
+            elif field.source in queryset._prefetch_related_lookups:
+                prefetch.append(field.source)
+
+        # Ordering columns are needed to compute the pagination cursor
+        only.extend(self.ordering_columns())
+        if queryset.query.select_related:
+            queryset = queryset.select_related(None)
+            if related:
+                queryset = queryset.select_related(*related)
+        return queryset.prefetch_related(None).prefetch_related(*prefetch).only(*only)
+
+    def list(self, request, *args, **kwargs):
+        if not (self.fast_fields and is_truthy(request.query_params.get('fast'))):
+            return super().list(request, *args, **kwargs)
+
+        names = [name for name in self.requested_field_names() if name in self.fast_fields]
+        lookups = {name: self.fast_fields[name] for name in names}
+        columns = set(lookups.values()) | set(self.ordering_columns())
+        queryset = super().filter_queryset(self.get_queryset()).values(*columns)
+
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+        data = [{name: row[lookup] for name, lookup in lookups.items()} for row in rows]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
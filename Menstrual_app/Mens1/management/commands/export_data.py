@@ -0,0 +1,32 @@
+import sys
+from django.core.management.base import BaseCommand
+from Mens1.exports import DATASETS, FORMATS, stream_export
+
+
+class Command(BaseCommand):
+    help = "Stream a dataset (optionally of one user) as CSV or NDJSON to a file or stdout."
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(DATASETS))
+        parser.add_argument('--format', dest='fmt', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--user-id', type=int, help="Only export this user's rows.")
+        parser.add_argument('--gzip', action='store_true', help="Compress the output with gzip.")
+        parser.add_argument('--database', help="Database alias to read from, e.g. replica.")
+        parser.add_argument('--output', help="File to write, stdout when omitted.")
+
+    def handle(self, *args, **options):
+        chunks = stream_export(
+            options['dataset'], options['fmt'], user_id=options['user_id'],
+            compress=options['gzip'], using=options['database'],
+        )
+        out = open(options['output'], 'wb') if options['output'] else sys.stdout.buffer
+        try:
+            written = 0
+            for chunk in chunks:
+                out.write(chunk)
+                written += len(chunk)
+        finally:
+            if options['output']:
+                out.close()
+        if options['output']:
+            self.stdout.write(self.style.SUCCESS(f"Wrote {written} bytes to {options['output']}."))
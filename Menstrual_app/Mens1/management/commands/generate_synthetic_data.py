@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from Mens1.synthetic import DEFAULT_PASSWORD, generate
+
+
+class Command(BaseCommand):
+    help = "Create synthetic users with cycles, flow logs, history, profiles and predictions."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000, help="Number of users to create.")
+        parser.add_argument('--cycles-per-user', type=int, default=12, help="Cycles generated per user.")
+        parser.add_argument('--flow-log-cycles', type=int, default=3,
+                            help="Log flow intensity for each user's N most recent cycles.")
+        parser.add_argument('--batch-users', type=int, default=1000, help="Users written per transaction.")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed, the same seed gives the same data.")
+        parser.add_argument('--prefix', default='synthetic-', help="Username prefix.")
+        parser.add_argument('--password', default=DEFAULT_PASSWORD, help="Password of every generated user.")
+
+    def handle(self, *args, **options):
+        def progress(done, counts):
+            self.stdout.write(f"  {done}/{options['users']} users, {counts['cycles']} cycles in last batch")
+
+        totals = generate(
+            options['users'],
+            cycles_per_user=options['cycles_per_user'],
+            flow_log_cycles=options['flow_log_cycles'],
+            batch_users=options['batch_users'],
+            seed=options['seed'],
+            prefix=options['prefix'],
+            password=options['password'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            "Created {users} users, {cycles} cycles, {flow_logs} flow logs, "
+            "{history} history entries and {predictions} predictions.".format(**totals)
+        ))
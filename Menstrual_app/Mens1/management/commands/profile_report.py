@@ -0,0 +1,36 @@
+import json
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from Mens1.profiling import PHASES, hot_functions
+
+
+class Command(BaseCommand):
+    help = "Summarize the request profiles written by ProfilingMiddleware into the hottest functions per endpoint."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dir', default=settings.MENS1_PROFILE_DIR, help="Directory holding the dumps.")
+        parser.add_argument('--endpoint', help='Only this endpoint, e.g. "GET menstrual-cycle-list".')
+        parser.add_argument('--limit', type=int, default=15, help="Functions listed per endpoint.")
+        parser.add_argument('--sort', choices=['tottime', 'cumtime'], default='tottime')
+        parser.add_argument('--json', action='store_true', help="Print the report as JSON.")
+
+    def handle(self, *args, **options):
+        reports = hot_functions(options['dir'], options['endpoint'], options['limit'], options['sort'])
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+        if not reports:
+            self.stdout.write(f"No profiles in {options['dir']}.")
+            return
+
+        for report in reports:
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{report['endpoint']}: {report['samples']} samples, {report['total_ms']:.1f} ms mean"
+            ))
+            self.stdout.write('  ' + ', '.join(f"{phase} {report['phases'][phase]:.1f} ms" for phase in PHASES))
+            self.stdout.write(f"  {'tottime ms':>10} {'cumtime ms':>10} {'calls':>9}  function")
+            for function in report['functions']:
+                self.stdout.write(
+                    f"  {function['tottime_ms']:>10.2f} {function['cumtime_ms']:>10.2f} "
+                    f"{function['calls']:>9.1f}  {function['function']}"
+                )
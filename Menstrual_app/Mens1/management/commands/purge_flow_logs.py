@@ -0,0 +1,33 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from Mens1.retention import flow_log_cutoff, purge_flow_logs
+
+
+class Command(BaseCommand):
+    help = "Delete flow intensity logs older than the retention period in small batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.FLOW_LOG_RETENTION_DAYS,
+                            help="Keep logs from the last N days.")
+        parser.add_argument('--batch-size', type=int, default=settings.RETENTION_BATCH_SIZE,
+                            help="Rows deleted per transaction.")
+        parser.add_argument('--pause', type=float, default=settings.RETENTION_BATCH_PAUSE,
+                            help="Seconds to sleep between batches.")
+        parser.add_argument('--start-after', type=int, default=0,
+                            help="Resume after this primary key (printed by a previous run).")
+
+    def handle(self, *args, **options):
+        cutoff = flow_log_cutoff(options['days'])
+        self.stdout.write(f"Purging flow logs dated before {cutoff}")
+
+        def progress(deleted, last_pk):
+            self.stdout.write(f"  deleted {deleted} rows, last pk {last_pk}")
+
+        deleted, last_pk = purge_flow_logs(
+            cutoff,
+            batch_size=options['batch_size'],
+            pause=options['pause'],
+            start_after=options['start_after'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} flow logs (last pk {last_pk})."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from Mens1.analytics import refresh_analytics
+
+
+class Command(BaseCommand):
+    help = "Update the population analytics histograms with the changes since the last run."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help="Recompute the histograms from scratch.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Users processed per batch.")
+
+    def handle(self, *args, **options):
+        processed = refresh_analytics(rebuild=options['rebuild'], chunk_size=options['chunk_size'])
+        if processed is None:
+            self.stdout.write(self.style.WARNING("Another analytics refresh is running, nothing done."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Analytics refreshed, {processed} users processed."))
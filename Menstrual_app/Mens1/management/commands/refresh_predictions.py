@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from Mens1.predictions import refresh_predictions, user_id_ranges
+
+
+class Command(BaseCommand):
+    help = "Recompute predictions for all users in chunks of user ids."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help="User ids per batch.")
+        parser.add_argument('--start-user-id', type=int, help="First user id to process.")
+        parser.add_argument('--end-user-id', type=int, help="Stop before this user id.")
+
+    def handle(self, *args, **options):
+        total_created = total_updated = 0
+        for start, end in user_id_ranges(options['chunk_size'], options['start_user_id'], options['end_user_id']):
+            created, updated = refresh_predictions(start, end)
+            total_created += created
+            total_updated += updated
+            if options['verbosity'] > 1:
+                self.stdout.write(f"  users {start}-{end - 1}: {created} created, {updated} updated")
+        self.stdout.write(self.style.SUCCESS(
+            f"Predictions refreshed: {total_created} created, {total_updated} updated."
+        ))
@@ -0,0 +1,64 @@
+import json
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from Mens1.benchmark import SCENARIOS, ClientTransport, HTTPTransport, find_regressions, run_benchmark
+from Mens1.synthetic import DEFAULT_PASSWORD
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the API routes concurrently and print throughput and p50/p95/p99 latency "
+            "per endpoint as JSON. Raise the user throttle rate (MENS1_THROTTLE_USER_RATE) first.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', help="Server to benchmark, e.g. http://localhost:8000. "
+                                               "Without it requests run in-process through the test client.")
+        parser.add_argument('--host', default='localhost',
+                            help="Host name of in-process requests, must be allowed by ALLOWED_HOSTS.")
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per endpoint.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent worker threads.")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per endpoint.")
+        parser.add_argument('--users', type=int, default=20, help="Number of users to log in and spread requests over.")
+        parser.add_argument('--prefix', default='synthetic-', help="Username prefix of the synthetic users.")
+        parser.add_argument('--password', default=DEFAULT_PASSWORD)
+        parser.add_argument('--endpoint', action='append', choices=[scenario[0] for scenario in SCENARIOS],
+                            help="Only run this endpoint, can be repeated.")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout.")
+        parser.add_argument('--baseline', help="JSON report of a previous run to compare against.")
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help="Allowed relative p95 growth over the baseline before failing.")
+
+    def handle(self, *args, **options):
+        usernames = list(
+            User.objects.filter(username__startswith=options['prefix'])
+            .order_by('id').values_list('username', flat=True)[:options['users']]
+        )
+        if not usernames:
+            raise CommandError("No synthetic users found, run generate_synthetic_data first.")
+
+        transport = HTTPTransport(options['base_url']) if options['base_url'] else ClientTransport(options['host'])
+        try:
+            report = run_benchmark(
+                transport, usernames,
+                requests=options['requests'],
+                concurrency=options['concurrency'],
+                warmup=options['warmup'],
+                scenarios=options['endpoint'],
+                password=options['password'],
+                seed=options['seed'],
+            )
+        except ValueError as exc:
+            raise CommandError(str(exc))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output)
+        else:
+            self.stdout.write(output)
+
+        if options['baseline']:
+            with open(options['baseline']) as fh:
+                regressions = find_regressions(report, json.load(fh), options['tolerance'])
+            if regressions:
+                raise CommandError("Latency regressions:\n" + "\n".join(regressions))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from Mens1.tasks import deliver_outbound_emails
+
+
+class Command(BaseCommand):
+    help = "Send pending outbox emails in this process, for setups without a Celery worker."
+
+    def handle(self, *args, **options):
+        total_sent = 0
+        while True:
+            sent = deliver_outbound_emails.apply().get()
+            if not sent:  # Nothing pending, or only failures left for a later run
+                break
+            total_sent += sent
+        self.stdout.write(self.style.SUCCESS(f"Outbox emails sent: {total_sent}."))
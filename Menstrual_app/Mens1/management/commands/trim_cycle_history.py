@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from Mens1.models import MenstrualCycleHistory
+
+
+class Command(BaseCommand):
+    help = "Delete cycle history entries beyond the per-user cap."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help="Only trim the history of this user id (repeatable).")
+
+    def handle(self, *args, **options):
+        deleted = MenstrualCycleHistory.trim_overflow(options['user_ids'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} history entries."))
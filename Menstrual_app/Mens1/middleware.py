@@ -0,0 +1,96 @@
+import logging
+import time
+from contextlib import ExitStack
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+class QueryCounter:
+    """Database execute wrapper counting queries and the time spent in them."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+class QueryBudgetMiddleware:
+    """
+    Record SQL query count and database time per request.
+
+    The numbers are sent back in X-DB-Query-Count / X-DB-Time-Ms headers and logged.
+    Requests exceeding the budget configured in MENS1_QUERY_BUDGETS for "<METHOD> <url name>"
+    or "<url name>" (or MENS1_QUERY_BUDGET_DEFAULT) log a warning, or raise
+    QueryBudgetExceeded when MENS1_QUERY_BUDGET_MODE is "raise".
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        counter = QueryCounter()
+        with self.counting(counter):
+            response = self.get_response(request)
+        return self.check_budget(request, response, counter)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        # Database connections are per thread, wrap the ones of the thread running this request's ORM calls
+        stack = await sync_to_async(self.counting)(counter)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+        return self.check_budget(request, response, counter)
+
+    def counting(self, counter):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(counter))
+        return stack
+
+    def check_budget(self, request, response, counter):
+        response['X-DB-Query-Count'] = str(counter.count)
+        response['X-DB-Time-Ms'] = f'{counter.duration * 1000:.1f}'
+
+        match = request.resolver_match
+        view_name = match.view_name if match else None
+        logger.debug(
+            "%s %s (%s): %d queries in %.1f ms",
+            request.method, request.path, view_name, counter.count, counter.duration * 1000,
+        )
+
+        budgets = settings.MENS1_QUERY_BUDGETS
+        budget = budgets.get(f'{request.method} {view_name}', budgets.get(view_name, settings.MENS1_QUERY_BUDGET_DEFAULT))
+        if budget is not None and counter.count > budget:
+            message = (
+                f"{request.method} {request.path} ({view_name}) ran {counter.count} queries, "
+                f"over its budget of {budget}"
+            )
+            if settings.MENS1_QUERY_BUDGET_MODE == 'raise':
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+        return response
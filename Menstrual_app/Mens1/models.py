@@ -3,8 +3,10 @@
 from django.db import models
 from django.contrib.auth.models import User
 from datetime import timedelta, date
-import datetime
 from django.utils import timezone
+from django.db import transaction
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
 
 
 # Flow Intensity options
@@ -31,52 +33,103 @@ class UserProfile(models.Model):
     cycle_state = models.CharField(
         max_length=20, choices=CYCLE_STATE_CHOICES, default="regular"
     )
+    updated_at = models.DateTimeField(auto_now=True)  # Read by the delta sync endpoint, see Mens1.sync
+
+    class Meta:
+        indexes = [models.Index(fields=['updated_at'], name='mens1_profile_updated_idx')]  # Analytics refresh
 
     def __str__(self):
         return f"Profile of {self.user.username}"
 
     def save(self, *args, **kwargs):
-        last_cycles = MenstrualCycle.objects.filter(user=self.user).order_by('-menstruation_start')[:6]
+        stats = CycleStatistics.objects.filter(user_id=self.user_id).first()
+        if stats is None:
+            # First save since statistics were introduced. Users without cycles get an empty row,
+            # so later saves read it instead of rebuilding again
+            stats = CycleStatistics.rebuild(self.user_id)
+            if stats is None:
+                stats, _ = CycleStatistics.objects.get_or_create(user_id=self.user_id)
 
-        if last_cycles:
-            cycle_lengths = [
-                (cycle.menstruation_end - cycle.menstruation_start).days for cycle in last_cycles if cycle.menstruation_end
-            ]
+        if stats and stats.last_menstruation_start:
+            self.apply_cycle_statistics(stats)
 
-            if cycle_lengths:
-                avg_cycle_length = sum(cycle_lengths) // len(cycle_lengths)  # Average cycle length
-                std_dev = max(cycle_lengths) - min(cycle_lengths)  # Cycle variability
+        super().save(*args, **kwargs)
 
-                # Classify cycle regularity
-                if std_dev <= 2:
-                    self.cycle_state = "regular"
-                elif 3 <= std_dev <= 6:
-                    self.cycle_state = "slightly_irregular"
-                else:
-                    self.cycle_state = "highly_irregular"
+    TIME_DEPENDENT_FIELDS = ['cycle_state', 'next_menstruation_start', 'menstruation_status', 'safe_sex_zone']
 
+    @classmethod
+    def refresh_time_dependent_fields(cls, start_user_id, end_user_id, today=None, batch_size=1000):
+        """
+        Re-derive the date-dependent fields of profiles with user ids in [start_user_id, end_user_id).
+
+        Reads the profiles and their cycle statistics with one query each and writes back
+        only the rows whose values changed, with bulk_update. Returns the number of updated profiles.
+        """
+        today = today or date.today()
+        profiles = list(
+            cls.objects.filter(user_id__gte=start_user_id, user_id__lt=end_user_id)
+            .only('id', 'user_id', 'updated_at', *cls.TIME_DEPENDENT_FIELDS)
+        )
+        statistics = {
+            stats.user_id: stats
+            for stats in CycleStatistics.objects.filter(
+                user_id__gte=start_user_id, user_id__lt=end_user_id, last_menstruation_start__isnull=False
+            )
+        }
+
+        changed = []
+        for profile in profiles:
+            stats = statistics.get(profile.user_id)
+            if stats is None:
+                continue  # save() leaves these fields alone as well
+            before = [getattr(profile, field) for field in cls.TIME_DEPENDENT_FIELDS]
+            profile.apply_cycle_statistics(stats, today)
+            if before != [getattr(profile, field) for field in cls.TIME_DEPENDENT_FIELDS]:
+                changed.append(profile)
+
+        if changed:
+            now = timezone.now()
+            for profile in changed:
+                profile.updated_at = now  # bulk_update does not apply auto_now
+            cls.objects.bulk_update(changed, [*cls.TIME_DEPENDENT_FIELDS, 'updated_at'], batch_size=batch_size)
+            from .caching import bump_user_version
+            bump_user_version(*[profile.user_id for profile in changed])  # bulk_update skips the signal handlers
+        return len(changed)
+
+    def apply_cycle_statistics(self, stats, today=None):
+        """Derive prediction and status fields from the user's rolling cycle statistics."""
+        today = today or date.today()
+
+        if stats.recent_lengths:
+            avg_cycle_length = stats.average_length  # Average cycle length
+            std_dev = stats.variability  # Cycle variability
+
+            # Classify cycle regularity
+            if std_dev <= 2:
+                self.cycle_state = "regular"
+            elif 3 <= std_dev <= 6:
+                self.cycle_state = "slightly_irregular"
             else:
-                self.cycle_state = "regular"  # Default when no valid data
-
-            last_cycle = last_cycles[0]  # Most recent cycle
+                self.cycle_state = "highly_irregular"
 
             # Predict next menstruation start using average cycle length
-            predicted_start_date = last_cycle.menstruation_end + timedelta(days=avg_cycle_length)
-            self.next_menstruation_start = predicted_start_date
+            if stats.last_menstruation_end:
+                self.next_menstruation_start = stats.last_menstruation_end + timedelta(days=avg_cycle_length)
+        else:
+            self.cycle_state = "regular"  # Default when no valid data
 
-            # Determine menstruation status
-            if last_cycle.menstruation_start <= date.today() <= last_cycle.menstruation_end:
-                self.menstruation_status = "Currently menstruating"
-            else:
-                self.menstruation_status = "Not menstruating"
-
-            # Determine safe sex zone
-            if last_cycle.ovulation_window_start <= date.today() <= last_cycle.ovulation_window_end:
-                self.safe_sex_zone = False  # Risky during ovulation
-            else:
-                self.safe_sex_zone = True  # Safe sex zone
+        # Determine menstruation status
+        if stats.last_menstruation_end and stats.last_menstruation_start <= today <= stats.last_menstruation_end:
+            self.menstruation_status = "Currently menstruating"
+        else:
+            self.menstruation_status = "Not menstruating"
 
-        super().save(*args, **kwargs)
+        # Determine safe sex zone
+        if (stats.last_ovulation_window_start and stats.last_ovulation_window_end
+                and stats.last_ovulation_window_start <= today <= stats.last_ovulation_window_end):
+            self.safe_sex_zone = False  # Risky during ovulation
+        else:
+            self.safe_sex_zone = True  # Safe sex zone
 
 
 class MenstrualCycle(models.Model):
@@ -90,8 +143,22 @@ class MenstrualCycle(models.Model):
     ovulation_date = models.DateField(null=True, blank=True)
     ovulation_window_start = models.DateField(null=True, blank=True)
     ovulation_window_end = models.DateField(null=True, blank=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Read by the delta sync endpoint, see Mens1.sync
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-menstruation_start'], name='mens1_cycle_user_start_idx'),
+            models.Index(fields=['user', 'updated_at'], name='mens1_cycle_user_updated_idx'),
+            models.Index(fields=['updated_at'], name='mens1_cycle_updated_idx'),  # Analytics refresh
+            models.Index(fields=['menstruation_start'], name='mens1_cycle_start_idx'),  # Admin date_hierarchy
+        ]
 
     def save(self, *args, **kwargs):
+        self.apply_derived_fields()
+        super().save(*args, **kwargs)
+
+    def apply_derived_fields(self):
+        """Fill in duration, cycle bounds and the ovulation window from the menstruation dates."""
         if self.menstruation_start and not self.menstruation_end:
             self.menstruation_end = self.menstruation_start + timedelta(days=5)
             self.menstruation_duration = 5  # Default duration
@@ -108,32 +175,176 @@ class MenstrualCycle(models.Model):
             self.ovulation_window_start = self.ovulation_date - timedelta(days=2)
             self.ovulation_window_end = self.ovulation_date + timedelta(days=2)
 
-        super().save(*args, **kwargs)
-
     def __str__(self):
         return f"Cycle {self.id} for {self.user.username}"
 
 
 
+# Rolling statistics over a user's most recent cycles, kept in step with MenstrualCycle writes
+# so that UserProfile.save reads a single row instead of rescanning the cycle history.
+class CycleStatistics(models.Model):
+    WINDOW_SIZE = 6  # Number of recent cycles the profile prediction is based on
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='cycle_statistics')
+    recent_lengths = models.JSONField(default=list)  # Ring buffer of recent cycle lengths, most recent first
+    length_sum = models.PositiveIntegerField(default=0)  # Running sum of recent_lengths
+    last_cycle = models.ForeignKey(
+        MenstrualCycle, on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
+    last_menstruation_start = models.DateField(null=True, blank=True)
+    last_menstruation_end = models.DateField(null=True, blank=True)
+    last_ovulation_window_start = models.DateField(null=True, blank=True)
+    last_ovulation_window_end = models.DateField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Cycle statistics for user {self.user_id}"
+
+    @property
+    def average_length(self):
+        return self.length_sum // len(self.recent_lengths) if self.recent_lengths else None
+
+    @property
+    def variability(self):
+        return max(self.recent_lengths) - min(self.recent_lengths) if self.recent_lengths else None
+
+    def push_cycle(self, cycle):
+        """Add a cycle that is newer than every tracked cycle to the front of the ring buffer."""
+        if cycle.menstruation_end:
+            length = (cycle.menstruation_end - cycle.menstruation_start).days
+            self.recent_lengths.insert(0, length)
+            self.length_sum += length
+            while len(self.recent_lengths) > self.WINDOW_SIZE:
+                self.length_sum -= self.recent_lengths.pop()
+        self.set_last_cycle(cycle)
+
+    def set_last_cycle(self, cycle):
+        self.last_cycle = cycle
+        self.last_menstruation_start = cycle.menstruation_start
+        self.last_menstruation_end = cycle.menstruation_end
+        self.last_ovulation_window_start = cycle.ovulation_window_start
+        self.last_ovulation_window_end = cycle.ovulation_window_end
+
+    @classmethod
+    def record_cycle(cls, cycle, created):
+        """Update the statistics after a cycle was created or edited."""
+        with transaction.atomic():
+            # Locked so that concurrent cycle writes of the user update the ring buffer one after the other
+            stats = cls.objects.select_for_update().filter(user_id=cycle.user_id).first()
+            is_newest = stats is not None and (
+                stats.last_menstruation_start is None
+                or cycle.menstruation_start >= stats.last_menstruation_start
+            )
+            if created and is_newest:
+                # Common case: a new cycle is appended, no history query needed
+                stats.push_cycle(cycle)
+                stats.save()
+                return stats
+
+            # Edits and out-of-order inserts can reshuffle the window, rebuild it under the same lock
+            return cls.rebuild(cycle.user_id, stats)
+
+    @classmethod
+    def rebuild(cls, user_id, stats=None):
+        """
+        Recompute the statistics from the user's most recent cycles.
+
+        ``stats`` is the user's row when the caller already holds its lock.
+        """
+        with transaction.atomic(savepoint=False):
+            if stats is None:
+                stats = cls.objects.select_for_update().filter(user_id=user_id).first()
+            last_cycles = list(
+                MenstrualCycle.objects.filter(user_id=user_id).order_by('-menstruation_start')[:cls.WINDOW_SIZE]
+            )
+            if not last_cycles:
+                cls.objects.filter(user_id=user_id).update(
+                    recent_lengths=[], length_sum=0, last_cycle=None,
+                    last_menstruation_start=None, last_menstruation_end=None,
+                    last_ovulation_window_start=None, last_ovulation_window_end=None,
+                )
+                return None
+
+            stats = stats or cls(user_id=user_id)
+            stats.recent_lengths = []
+            stats.length_sum = 0
+            for cycle in reversed(last_cycles):
+                stats.push_cycle(cycle)
+            stats.save()
+            return stats
+
+
 # Flow Intensity log model to record daily flow intensity
 class FlowIntensityLog(models.Model):
+    UPSERT_FIELDS = ['cycle', 'intensity', 'updated_at']  # Overwritten when a log for the same day is sent again
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     cycle = models.ForeignKey(MenstrualCycle, on_delete=models.CASCADE)
     date = models.DateField()  # Date of the record
     intensity = models.CharField(max_length=10, choices=FLOW_INTENSITY_CHOICES, default='Light')  # Intensity for the day
+    updated_at = models.DateTimeField(auto_now=True)  # Read by the delta sync endpoint, see Mens1.sync
+
+    class Meta:
+        constraints = [
+            # One log per user and day, also the (user, date) index used by range reads
+            models.UniqueConstraint(fields=['user', 'date'], name='mens1_flowlog_user_date_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'updated_at'], name='mens1_flowlog_user_updated_idx'),
+            models.Index(fields=['date'], name='mens1_flowlog_date_idx'),  # Admin date_hierarchy
+        ]
 
     def __str__(self):
         return f"Flow Intensity for {self.user.username} on {self.date}"
 
+    @classmethod
+    def upsert(cls, logs, batch_size=500):
+        """
+        Insert logs or overwrite the existing ones for the same user and date, in one statement per batch.
+
+        Logs identical to the stored ones are not written, so sending the same logs again leaves the
+        table, ``updated_at`` and the cache versions unchanged and clients can retry freely.
+        Returns the logs with their primary keys set.
+        """
+        # A statement may not update the same row twice, the last log for a day wins
+        logs = list({(log.user_id, log.date): log for log in logs}.values())
+        written = []
+        with transaction.atomic():
+            for start in range(0, len(logs), batch_size):
+                batch = logs[start:start + batch_size]
+                existing = {
+                    (user_id, day): (pk, cycle_id, intensity)
+                    for user_id, day, pk, cycle_id, intensity in cls.objects.filter(
+                        user_id__in={log.user_id for log in batch}, date__in={log.date for log in batch}
+                    ).values_list('user_id', 'date', 'id', 'cycle_id', 'intensity')
+                }
+                changed = []
+                for log in batch:
+                    pk, cycle_id, intensity = existing.get((log.user_id, log.date), (None, None, None))
+                    log.pk = pk
+                    if pk is None or (cycle_id, intensity) != (log.cycle_id, log.intensity):
+                        changed.append(log)
+                if changed:
+                    cls.objects.bulk_create(
+                        changed, update_conflicts=True, unique_fields=['user', 'date'], update_fields=cls.UPSERT_FIELDS,
+                    )
+                    written.extend(changed)
+        if written:
+            from .caching import bump_user_version
+            bump_user_version(*{log.user_id for log in written})  # bulk_create skips the signal handlers
+        return logs
+
     @classmethod
     def clean_old_data(cls):
-        """Method to clean data older than 3 months."""
-        three_months_ago = timezone.now().date() - timedelta(days=90)
-        cls.objects.filter(date__lt=three_months_ago).delete()
+        """Method to clean data older than 3 months, in batches (see Mens1.retention)."""
+        from .retention import flow_log_cutoff, purge_flow_logs
+        deleted, _ = purge_flow_logs(flow_log_cutoff())
+        return deleted
 
 
 # Menstrual Cycle History model to store previous cycles
 class MenstrualCycleHistory(models.Model):
+    MAX_HISTORY_ENTRIES = 12  # Cycles kept per user, enforced by trim_overflow
+
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     related_cycle = models.ForeignKey(
         MenstrualCycle, on_delete=models.SET_NULL, null=True, blank=True
@@ -143,6 +354,14 @@ class MenstrualCycleHistory(models.Model):
     cycle_length = models.IntegerField()
     flow_logs = models.ManyToManyField(FlowIntensityLog, blank=True)
     symptoms = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Read by the delta sync endpoint, see Mens1.sync
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', '-start_date'], name='mens1_history_user_start_idx'),
+            models.Index(fields=['user', 'updated_at'], name='mens1_history_user_updated_idx'),
+            models.Index(fields=['start_date'], name='mens1_history_start_idx'),  # Admin date_hierarchy
+        ]
 
     def save(self, *args, **kwargs):
         # Automatically calculate cycle length
@@ -151,11 +370,34 @@ class MenstrualCycleHistory(models.Model):
 
         super().save(*args, **kwargs)
 
-        # Keep only the last 12 cycles (delete the oldest one if necessary)
-        MAX_HISTORY_ENTRIES = 12
-        past_cycles = MenstrualCycleHistory.objects.filter(user=self.user).order_by("-start_date")
-        if past_cycles.count() > MAX_HISTORY_ENTRIES:
-            past_cycles.last().delete()  # Delete the oldest cycle
+    @classmethod
+    def trim_overflow(cls, user_ids=None):
+        """
+        Keep only the last MAX_HISTORY_ENTRIES cycles per user.
+
+        Runs as a single set-based DELETE (plus one for the flow log links) for any number
+        of users, so the write path stays a plain INSERT and trimming can be batched.
+        Deleted entries are recorded as tombstones for delta sync. Returns the number of deleted entries.
+        """
+        ranked = cls.objects.annotate(
+            rank=Window(RowNumber(), partition_by=F('user_id'), order_by=[F('start_date').desc(), F('id').desc()])
+        )
+        if user_ids is not None:
+            ranked = ranked.filter(user_id__in=user_ids)
+        overflow = ranked.filter(rank__gt=cls.MAX_HISTORY_ENTRIES)
+
+        using = cls.objects.db
+        with transaction.atomic(using=using):
+            overflow_rows = list(overflow.values_list('pk', 'user_id'))
+            affected_users = {user_id for _, user_id in overflow_rows}
+            Tombstone.record(cls, overflow_rows)
+            cls.flow_logs.through.objects.filter(menstrualcyclehistory_id__in=overflow.values('pk'))._raw_delete(using)
+            deleted = cls.objects.filter(pk__in=overflow.values('pk'))._raw_delete(using)
+
+        if affected_users:
+            from .caching import bump_user_version
+            bump_user_version(*affected_users)  # Raw deletes bypass the signal handlers
+        return deleted
 
     def __str__(self):
         return f"Cycle ({self.start_date} - {self.end_date}) - {self.user.username}"
@@ -168,6 +410,15 @@ class Prediction(models.Model):
     ovulation_prediction_accuracy = models.PositiveIntegerField(default=50)  # Accuracy of the ovulation prediction
     next_period_prediction = models.DateField(null=True, blank=True)  # Predicted date of the next period
     ovulation_prediction = models.DateField(null=True, blank=True)  # Predicted ovulation date
+    updated_at = models.DateTimeField(auto_now=True)  # Read by the delta sync endpoint, see Mens1.sync
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'next_period_prediction'], name='mens1_pred_user_next_idx'),
+            models.Index(fields=['user', 'updated_at'], name='mens1_pred_user_updated_idx'),
+            models.Index(fields=['updated_at'], name='mens1_pred_updated_idx'),  # Analytics refresh
+            models.Index(fields=['next_period_prediction'], name='mens1_pred_next_idx'),  # Admin date_hierarchy
+        ]
 
     def save(self, *args, **kwargs):
         # Automatically calculate predictions based on the menstrual cycle data
@@ -186,4 +437,106 @@ class Prediction(models.Model):
             self.ovulation_prediction = self.next_period_prediction - timedelta(days=14)
 
     def __str__(self):
-        return f"Prediction for {self.user.username} based on Cycle {self.menstrual_cycle.id}"
\ No newline at end of file
+        return f"Prediction for {self.user.username} based on Cycle {self.menstrual_cycle.id}"
+
+# Record of a deleted row, so that delta sync clients learn about deletions.
+# user_id is a plain column: tombstones must outlive the rows (and users) they describe.
+class Tombstone(models.Model):
+    user_id = models.IntegerField()
+    model = models.CharField(max_length=50)  # Model name, e.g. "menstrualcycle"
+    object_id = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user_id', 'deleted_at'], name='mens1_tombstone_user_del_idx'),
+            models.Index(fields=['deleted_at'], name='mens1_tombstone_deleted_idx'),  # Purging, analytics refresh
+        ]
+
+    def __str__(self):
+        return f"Deleted {self.model} {self.object_id} of user {self.user_id}"
+
+    @classmethod
+    def record(cls, model, rows):
+        """Bulk-record deletions of ``model`` given (object_id, user_id) pairs."""
+        now = timezone.now()
+        cls.objects.bulk_create([
+            cls(user_id=user_id, model=model._meta.model_name, object_id=object_id, deleted_at=now)
+            for object_id, user_id in rows
+        ])
+
+
+# Pre-aggregated population histograms, maintained by Mens1.analytics
+class AnalyticsBucket(models.Model):
+    metric = models.CharField(max_length=30)  # e.g. "cycle_length"
+    age_group = models.CharField(max_length=10)  # e.g. "25-29"
+    value = models.CharField(max_length=30)  # Histogram bucket, e.g. "28" or "regular"
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['metric', 'age_group', 'value'], name='mens1_analytics_bucket_uniq'),
+        ]
+
+    def __str__(self):
+        return f"{self.metric} {self.age_group} {self.value}: {self.count}"
+
+
+# What one user currently adds to the histograms, so a change can be applied as a difference.
+# user_id is a plain column: the contribution of a deleted user still has to be subtracted.
+class AnalyticsContribution(models.Model):
+    user_id = models.IntegerField(unique=True)
+    age_group = models.CharField(max_length=10)
+    histogram = models.JSONField(default=dict)  # {metric: {value: count}}
+
+    def __str__(self):
+        return f"Analytics contribution of user {self.user_id}"
+
+
+# Watermark of the periodic analytics refresh
+class AnalyticsState(models.Model):
+    key = models.CharField(max_length=50, unique=True)
+    processed_until = models.DateTimeField(null=True, blank=True)  # None until the first full build
+    running_since = models.DateTimeField(null=True, blank=True)  # Set while a refresh holds the run lease
+
+    def __str__(self):
+        return f"{self.key}: {self.processed_until}"
+
+
+# Outbox of emails waiting to be delivered by the Celery worker, so requests never wait on SMTP
+class OutboundEmail(models.Model):
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=254, blank=True)
+    recipient = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    claim_token = models.UUIDField(null=True, blank=True)  # Set while a worker is delivering the row
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=['status', 'id'])]
+
+    def __str__(self):
+        return f"Email to {self.recipient} ({self.status})"
+
+
+# Sliding-window request counters shared by all workers, one row per throttled client
+class ThrottleCounter(models.Model):
+    key = models.CharField(max_length=255, unique=True)
+    window = models.BigIntegerField()  # Index of the current window since the epoch
+    current = models.PositiveIntegerField(default=0)  # Requests in the current window
+    previous = models.PositiveIntegerField(default=0)  # Requests in the window before it
+
+    def __str__(self):
+        return f"{self.key}: {self.current} (+{self.previous} previous)"
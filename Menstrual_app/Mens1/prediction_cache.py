@@ -0,0 +1,130 @@
+"""
+In-process LRU cache of each user's prediction bundle.
+
+A bundle is everything the "when is my next period" screen needs: next period,
+ovulation date and window, accuracy and cycle_state. Entries are tagged with
+the user's data version (see caching.py), which every cycle, flow log,
+prediction and profile write replaces, so a hit is always current and costs
+no database query. The cache is bounded both by entry count and by an
+estimate of its memory use, least recently used entries are evicted first.
+"""
+import sys
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+from django.conf import settings
+from .caching import get_user_version
+from .models import Prediction, UserProfile
+
+OVULATION_WINDOW_DAYS = 2  # Days on each side of the ovulation date, as in MenstrualCycle
+
+
+def bundle_size(bundle):
+    """Rough memory footprint of a bundle in bytes."""
+    return sys.getsizeof(bundle) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in bundle.items())
+
+
+class PredictionBundleCache:
+    def __init__(self, max_entries=None, max_bytes=None):
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()  # user_id -> (version, bundle, size)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.stale = self.evictions = 0
+
+    @property
+    def max_entries(self):
+        return settings.MENS1_PREDICTION_CACHE_SIZE if self._max_entries is None else self._max_entries
+
+    @property
+    def max_bytes(self):
+        return settings.MENS1_PREDICTION_CACHE_MAX_BYTES if self._max_bytes is None else self._max_bytes
+
+    def get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry[0] != version:
+                # The user's data changed since the bundle was computed
+                self._remove(user_id)
+                self.misses += 1
+                self.stale += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return dict(entry[1])
+
+    def set(self, user_id, version, bundle):
+        if self.max_entries <= 0:
+            return
+        size = bundle_size(bundle)
+        with self._lock:
+            self._remove(user_id)
+            self._entries[user_id] = (version, dict(bundle), size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _remove(self, user_id):
+        entry = self._entries.pop(user_id, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            self.hits = self.misses = self.stale = self.evictions = 0
+
+    def metrics(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale': self.stale,
+                'evictions': self.evictions,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+prediction_cache = PredictionBundleCache()
+
+
+def build_prediction_bundle(user_id):
+    """Read the user's latest prediction and cycle_state from the database."""
+    prediction = (
+        Prediction.objects.filter(user_id=user_id)
+        .order_by('-next_period_prediction', '-id')
+        .values('next_period_prediction', 'ovulation_prediction', 'ovulation_prediction_accuracy')
+        .first()
+    ) or {}
+    ovulation = prediction.get('ovulation_prediction')
+    window = timedelta(days=OVULATION_WINDOW_DAYS)
+    return {
+        'next_period': prediction.get('next_period_prediction'),
+        'ovulation_date': ovulation,
+        'ovulation_window_start': ovulation - window if ovulation else None,
+        'ovulation_window_end': ovulation + window if ovulation else None,
+        'accuracy': prediction.get('ovulation_prediction_accuracy'),
+        'cycle_state': UserProfile.objects.filter(user_id=user_id).values_list('cycle_state', flat=True).first(),
+    }
+
+
+def get_prediction_bundle(user_id):
+    """Return the user's prediction bundle, from the cache when their data has not changed."""
+    version, _ = get_user_version(user_id)
+    bundle = prediction_cache.get(user_id, version)
+    if bundle is None:
+        bundle = build_prediction_bundle(user_id)
+        prediction_cache.set(user_id, version, bundle)
+    return bundle
@@ -0,0 +1,150 @@
+"""
+Batch prediction engine.
+
+Loads the recent cycle history of a range of users as columnar NumPy arrays and
+computes every user's prediction at once: the average interval between period
+starts, its variability, the next period and ovulation dates and an accuracy
+score. Results are upserted into Prediction with bulk queries, one chunk of
+user ids at a time.
+"""
+from datetime import date
+import numpy as np
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F, Max, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from .caching import bump_user_version
+from .models import MenstrualCycle, Prediction
+
+HISTORY_WINDOW = 6  # Most recent cycles per user taken into account
+LUTEAL_PHASE_DAYS = 14  # Ovulation happens about 14 days before the next period
+MAX_ACCURACY, MIN_ACCURACY = 95, 50
+ACCURACY_PENALTY_PER_DAY = 5  # Accuracy lost per day of standard deviation in cycle length
+
+
+def load_cycle_arrays(start_user_id, end_user_id):
+    """Return the recent cycles of users in [start_user_id, end_user_id) as arrays sorted by user, newest first."""
+    rows = list(
+        MenstrualCycle.objects.filter(user_id__gte=start_user_id, user_id__lt=end_user_id)
+        .annotate(rank=Window(RowNumber(), partition_by=F('user_id'), order_by=F('menstruation_start').desc()))
+        .filter(rank__lte=HISTORY_WINDOW)
+        .order_by('user_id', '-menstruation_start')
+        .values_list('id', 'user_id', 'menstruation_start', 'cycle_length')
+    )
+    count = len(rows)
+    cycle_ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=count)
+    user_ids = np.fromiter((row[1] for row in rows), dtype=np.int64, count=count)
+    starts = np.fromiter((row[2].toordinal() for row in rows), dtype=np.int64, count=count)
+    lengths = np.fromiter((row[3] for row in rows), dtype=np.int64, count=count)
+    return cycle_ids, user_ids, starts, lengths
+
+
+def compute_predictions(cycle_ids, user_ids, starts, lengths):
+    """
+    Compute predictions for every user in the arrays.
+
+    The arrays must be grouped by user with the newest cycle first. Returns a dict of
+    arrays with one entry per user.
+    """
+    if not len(user_ids):
+        empty = np.array([], dtype=np.int64)
+        return {key: empty for key in ('user_id', 'cycle_id', 'average_length', 'variability',
+                                       'next_period', 'ovulation', 'accuracy')}
+
+    # Index of each user's newest cycle
+    firsts = np.flatnonzero(np.r_[True, user_ids[1:] != user_ids[:-1]])
+
+    # Interval between each cycle and the one before it, only within the same user
+    has_previous = np.r_[user_ids[:-1] == user_ids[1:], False]
+    gaps = np.where(has_previous, starts - np.r_[starts[1:], 0], 0).astype(np.float64)
+
+    gap_count = np.add.reduceat(has_previous.astype(np.int64), firsts)
+    gap_sum = np.add.reduceat(gaps, firsts)
+    gap_sq_sum = np.add.reduceat(gaps ** 2, firsts)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.where(gap_count > 0, gap_sum / gap_count, lengths[firsts])
+        variance = np.where(gap_count > 1, gap_sq_sum / gap_count - mean ** 2, 0.0)
+    variability = np.sqrt(np.clip(variance, 0, None))
+
+    average_length = np.rint(mean).astype(np.int64)
+    next_period = starts[firsts] + average_length
+    accuracy = np.clip(
+        np.rint(MAX_ACCURACY - ACCURACY_PENALTY_PER_DAY * variability), MIN_ACCURACY, MAX_ACCURACY
+    ).astype(np.int64)
+
+    return {
+        'user_id': user_ids[firsts],
+        'cycle_id': cycle_ids[firsts],
+        'average_length': average_length,
+        'variability': variability,
+        'next_period': next_period,
+        'ovulation': next_period - LUTEAL_PHASE_DAYS,
+        'accuracy': accuracy,
+    }
+
+
+def save_predictions(results, batch_size=1000):
+    """
+    Upsert one Prediction per (user, latest cycle) with bulk queries, skipping rows whose
+    values did not change. Returns (created, updated).
+    """
+    existing = {}
+    # Newest first, like the views pick the current prediction, so duplicates keep the row clients see
+    for pk, user_id, cycle_id, *values in Prediction.objects.filter(
+        menstrual_cycle_id__in=results['cycle_id'].tolist()
+    ).order_by('-id').values_list(
+        'id', 'user_id', 'menstrual_cycle_id',
+        'next_period_prediction', 'ovulation_prediction', 'ovulation_prediction_accuracy',
+    ):
+        existing.setdefault((user_id, cycle_id), (pk, values))
+
+    now = timezone.now()  # bulk_update does not apply auto_now
+    to_create, to_update = [], []
+    for user_id, cycle_id, next_period, ovulation, accuracy in zip(
+        results['user_id'].tolist(), results['cycle_id'].tolist(), results['next_period'].tolist(),
+        results['ovulation'].tolist(), results['accuracy'].tolist(),
+    ):
+        values = [date.fromordinal(next_period), date.fromordinal(ovulation), accuracy]
+        pk, current = existing.get((user_id, cycle_id), (None, None))
+        if current == values:
+            continue  # Unchanged, keep updated_at so sync and analytics skip the row
+        prediction = Prediction(
+            pk=pk,
+            user_id=user_id,
+            menstrual_cycle_id=cycle_id,
+            next_period_prediction=values[0],
+            ovulation_prediction=values[1],
+            ovulation_prediction_accuracy=accuracy,
+            updated_at=now,
+        )
+        (to_update if prediction.pk else to_create).append(prediction)
+
+    with transaction.atomic():
+        Prediction.objects.bulk_create(to_create, batch_size=batch_size)
+        Prediction.objects.bulk_update(
+            to_update,
+            ['next_period_prediction', 'ovulation_prediction', 'ovulation_prediction_accuracy', 'updated_at'],
+            batch_size=batch_size,
+        )
+    changed_users = [prediction.user_id for prediction in to_create + to_update]
+    if changed_users:
+        bump_user_version(*changed_users)
+    return len(to_create), len(to_update)
+
+
+def refresh_predictions(start_user_id, end_user_id):
+    """Recompute and store predictions for users with ids in [start_user_id, end_user_id)."""
+    results = compute_predictions(*load_cycle_arrays(start_user_id, end_user_id))
+    return save_predictions(results)
+
+
+def user_id_ranges(chunk_size, start_user_id=None, end_user_id=None):
+    """Yield (start, end) user id ranges of at most chunk_size ids covering all users."""
+    if start_user_id is None:
+        start_user_id = 1
+    if end_user_id is None:
+        end_user_id = (User.objects.aggregate(max_id=Max('id'))['max_id'] or 0) + 1
+    for start in range(start_user_id, end_user_id, chunk_size):
+        yield start, min(start + chunk_size, end_user_id)
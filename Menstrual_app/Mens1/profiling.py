@@ -0,0 +1,206 @@
+"""
+Opt-in request profiling.
+
+ProfilingMiddleware runs cProfile around a random MENS1_PROFILE_SAMPLE_RATE
+share of requests, and around requests sending the MENS1_PROFILE_HEADER header
+together with the JWT of a staff user (the header is ignored for anyone else,
+so it cannot be used to slow the server down). Each profiled request leaves
+a marshalled pstats dump and a JSON sidecar in MENS1_PROFILE_DIR, the oldest
+are removed once there are more than MENS1_PROFILE_MAX_FILES.
+
+Phase timings are read from the profile itself, as the time spent in the
+functions of each phase when called from outside of it, so unprofiled requests
+pay nothing beyond the sampling check. Phases can overlap: a lazy query run
+while serializing counts for both "queryset" and "serialization".
+"""
+import cProfile
+import json
+import logging
+import os
+import pstats
+import random
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken
+from .authentication import CachedJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+# Phase -> (path fragment, function name or None for every function of the file)
+PHASES = {
+    'authentication': [('rest_framework/views.py', 'perform_authentication')],
+    'throttling': [('rest_framework/views.py', 'check_throttles')],
+    'queryset': [('django/db/models/query.py', None), ('django/db/models/sql/', None)],
+    'serialization': [
+        ('rest_framework/serializers.py', None), ('rest_framework/fields.py', None),
+        ('rest_framework/relations.py', None), ('Mens1/serializers.py', None), ('Mens1/fieldsets.py', None),
+    ],
+    'rendering': [('rest_framework/response.py', 'rendered_content')],
+}
+
+
+def in_phase(func, matchers):
+    filename, _, name = func
+    filename = filename.replace(os.sep, '/')
+    return any(fragment in filename and (function is None or function == name) for fragment, function in matchers)
+
+
+def phase_timings(stats):
+    """Return {phase: milliseconds} from a pstats.Stats."""
+    timings = {}
+    for phase, matchers in PHASES.items():
+        total = 0.0
+        for func, (_, _, _, cumulative, callers) in stats.stats.items():
+            if not in_phase(func, matchers):
+                continue
+            if not callers:
+                total += cumulative
+            # Only count entries into the phase, calls within it are part of the caller's time
+            total += sum(timing[3] for caller, timing in callers.items() if not in_phase(caller, matchers))
+        timings[phase] = round(total * 1000, 3)
+    return timings
+
+
+def endpoint_name(request):
+    match = request.resolver_match
+    return f'{request.method} {match.view_name if match else request.path}'
+
+
+def write_dump(profiler, metadata, directory, max_files):
+    """Write the profile and its sidecar, then drop the oldest dumps over ``max_files``."""
+    os.makedirs(directory, exist_ok=True)
+    name = f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+    profiler.dump_stats(os.path.join(directory, f'{name}.prof'))
+    with open(os.path.join(directory, f'{name}.json'), 'w') as sidecar:
+        json.dump(metadata, sidecar)
+
+    dumps = sorted(entry for entry in os.listdir(directory) if entry.endswith('.prof'))
+    for old in dumps[:max(len(dumps) - max_files, 0)]:
+        for suffix in ('.prof', '.json'):
+            try:
+                os.remove(os.path.join(directory, old[:-len('.prof')] + suffix))
+            except FileNotFoundError:
+                pass
+    return name
+
+
+class ProfilingMiddleware:
+    """
+    Profile sampled or explicitly requested requests, see the module docstring.
+
+    Only synchronous requests are profiled, cProfile follows a single thread
+    and an async request moves between the event loop and worker threads.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.header = 'HTTP_' + settings.MENS1_PROFILE_HEADER.upper().replace('-', '_')
+
+    @staticmethod
+    def is_staff(request):
+        """Authenticate the request's bearer token up front, through the cached user lookup."""
+        try:
+            result = CachedJWTAuthentication().authenticate(request)
+        except (AuthenticationFailed, InvalidToken):
+            return False
+        return result is not None and result[0].is_staff
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.get_response(request)
+
+        sample_rate = settings.MENS1_PROFILE_SAMPLE_RATE
+        sampled = sample_rate > 0 and random.random() < sample_rate
+        requested = not sampled and self.header in request.META and self.is_staff(request)
+        if not (sampled or requested):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        start = time.perf_counter()
+        profiler.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        elapsed = time.perf_counter() - start
+
+        metadata = {
+            'endpoint': endpoint_name(request),
+            'path': request.path,
+            'status': response.status_code,
+            'trigger': 'sample' if sampled else 'header',
+            'timestamp': time.time(),
+            'total_ms': round(elapsed * 1000, 3),
+            'phases': phase_timings(pstats.Stats(profiler)),
+        }
+        try:
+            name = write_dump(profiler, metadata, settings.MENS1_PROFILE_DIR, settings.MENS1_PROFILE_MAX_FILES)
+        except OSError:
+            logger.warning("Could not write the profile of %s %s", request.method, request.path, exc_info=True)
+            return response
+        if requested:
+            response['X-Profile-Id'] = name
+        return response
+
+
+def load_dumps(directory, endpoint=None):
+    """Return {endpoint: [(metadata, profile path), ...]} for the dumps in ``directory``."""
+    dumps = defaultdict(list)
+    if not os.path.isdir(directory):
+        return dumps
+    for entry in sorted(os.listdir(directory)):
+        if not entry.endswith('.json'):
+            continue
+        path = os.path.join(directory, entry[:-len('.json')] + '.prof')
+        try:
+            with open(os.path.join(directory, entry)) as sidecar:
+                metadata = json.load(sidecar)
+        except (OSError, ValueError):
+            continue  # Removed by rotation or half written
+        if os.path.exists(path) and (endpoint is None or metadata['endpoint'] == endpoint):
+            dumps[metadata['endpoint']].append((metadata, path))
+    return dumps
+
+
+def hot_functions(directory, endpoint=None, limit=15, sort='tottime'):
+    """
+    Aggregate the dumps per endpoint. Returns a list of reports with the number of
+    samples, mean total and phase timings and the ``limit`` hottest functions, times
+    in milliseconds per request.
+    """
+    sort_index = {'tottime': 2, 'cumtime': 3}[sort]
+    reports = []
+    for name, dumps in sorted(load_dumps(directory, endpoint).items()):
+        samples = len(dumps)
+        stats = pstats.Stats(*[path for _, path in dumps])
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][sort_index], reverse=True)[:limit]
+        reports.append({
+            'endpoint': name,
+            'samples': samples,
+            'total_ms': round(sum(metadata['total_ms'] for metadata, _ in dumps) / samples, 3),
+            'phases': {
+                phase: round(sum(metadata['phases'].get(phase, 0) for metadata, _ in dumps) / samples, 3)
+                for phase in PHASES
+            },
+            'functions': [
+                {
+                    'function': pstats.func_std_string(func),
+                    'calls': calls / samples,
+                    'tottime_ms': round(tottime * 1000 / samples, 3),
+                    'cumtime_ms': round(cumtime * 1000 / samples, 3),
+                }
+                for func, (_, calls, tottime, cumtime, _) in functions
+            ],
+        })
+    return reports
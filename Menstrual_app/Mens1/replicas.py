@@ -0,0 +1,90 @@
+"""
+Read-replica routing for the Mens1 API.
+
+Reads of Mens1 models go to the "replica" database alias only while a view has
+opted in through ReplicaReadMixin. Any write during the request pins the rest of
+it to the primary, and a user who wrote within MENS1_REPLICA_PIN_SECONDS keeps
+reading from the primary, so clients always see their own writes.
+"""
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from rest_framework.permissions import SAFE_METHODS
+from .caching import get_user_version
+
+REPLICA_ALIAS = 'replica'
+PRIMARY_ONLY_MODELS = {'throttlecounter', 'outboundemail'}  # Bookkeeping tables written on every request
+
+_routing = ContextVar('mens1_replica_routing', default=None)
+
+
+def replica_available():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+class ReplicaRoutingMiddleware:
+    """Give every request fresh routing state; reads default to the primary."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(self.get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = _routing.set({'use_replica': False, 'pinned': False})
+        try:
+            return self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+    async def __acall__(self, request):
+        token = _routing.set({'use_replica': False, 'pinned': False})
+        try:
+            return await self.get_response(request)
+        finally:
+            _routing.reset(token)
+
+
+class ReplicaReadMixin:
+    """View mixin letting safe requests of users without recent writes read from the replica."""
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        state = _routing.get()
+        if state is None or not replica_available() or request.method not in SAFE_METHODS:
+            return
+        if request.user.is_authenticated:
+            _, last_modified = get_user_version(request.user.pk)
+            if time.time() - last_modified < settings.MENS1_REPLICA_PIN_SECONDS:
+                return
+        state['use_replica'] = True
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if (
+            state and state['use_replica'] and not state['pinned']
+            and model._meta.app_label == 'Mens1' and model._meta.model_name not in PRIMARY_ONLY_MODELS
+        ):
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state and model._meta.model_name not in PRIMARY_ONLY_MODELS:
+            state['pinned'] = True  # Read-your-writes for the rest of the request
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA_ALIAS
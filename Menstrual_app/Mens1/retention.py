@@ -0,0 +1,52 @@
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .caching import bump_user_version
+from .models import FlowIntensityLog, MenstrualCycleHistory
+
+
+def flow_log_cutoff(days=None):
+    """Return the first date that is still kept by the flow log retention policy."""
+    if days is None:
+        days = settings.FLOW_LOG_RETENTION_DAYS
+    return timezone.now().date() - timedelta(days=days)
+
+
+def purge_flow_logs(cutoff, batch_size=None, pause=None, start_after=0, progress=None):
+    """
+    Delete flow logs dated before ``cutoff`` in bounded primary-key batches.
+
+    Each batch is its own short transaction, so writers only wait for one batch
+    and an interrupted run can be resumed from the last reported primary key.
+    Rows are deleted with raw DELETE statements, no model instances are loaded.
+    Returns a ``(deleted, last_pk)`` tuple.
+    """
+    batch_size = batch_size or settings.RETENTION_BATCH_SIZE
+    pause = settings.RETENTION_BATCH_PAUSE if pause is None else pause
+    through = MenstrualCycleHistory.flow_logs.through
+    using = FlowIntensityLog.objects.db
+
+    deleted, last_pk = 0, start_after
+    while True:
+        rows = list(
+            FlowIntensityLog.objects.filter(date__lt=cutoff, pk__gt=last_pk)
+            .order_by('pk').values_list('pk', 'user_id')[:batch_size]
+        )
+        if not rows:
+            break
+        pks = [pk for pk, _ in rows]
+
+        with transaction.atomic(using=using):
+            through.objects.filter(flowintensitylog_id__in=pks)._raw_delete(using)
+            deleted += FlowIntensityLog.objects.filter(pk__in=pks)._raw_delete(using)
+        bump_user_version(*(user_id for _, user_id in rows))  # Raw deletes bypass the signal handlers
+
+        last_pk = pks[-1]
+        if progress:
+            progress(deleted, last_pk)
+        if pause:
+            time.sleep(pause)  # Give waiting writers a chance to take the lock
+
+    return deleted, last_pk
@@ -1,9 +1,18 @@
+from collections import Counter
 from datetime import timedelta
 from rest_framework import serializers
-from .models import MenstrualCycle, MenstrualCycleHistory, FlowIntensityLog, Prediction, UserProfile
+from django.db import transaction
+from django.utils import timezone
+from .caching import bump_user_version
+from .fieldsets import SparseFieldsetSerializerMixin
+from .timeline import MAX_RANGE_DAYS
+from .models import (
+    MenstrualCycle, MenstrualCycleHistory, FlowIntensityLog, Prediction, UserProfile, CycleStatistics,
+    FLOW_INTENSITY_CHOICES
+)
 from django.contrib.auth.models import User
 
-class UserProfileSerializer(serializers.ModelSerializer):
+class UserProfileSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     user = serializers.SlugRelatedField(slug_field='username', queryset=User.objects.all())
     
     class Meta:
@@ -50,7 +59,7 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
         return user
     
 
-class MenstrualCycleSerializer(serializers.ModelSerializer):
+class MenstrualCycleSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     ovulation_date = serializers.DateField(read_only=True)
     next_period_prediction = serializers.DateField(read_only=True)
     cycle_length = serializers.IntegerField(read_only=True)
@@ -88,13 +97,13 @@ class FlowIntensityLogSerializer(serializers.ModelSerializer):
         model = FlowIntensityLog
         fields = ['id', 'cycle', 'date', 'intensity']
 
-class MenstrualCycleHistorySerializer(serializers.ModelSerializer):
+class MenstrualCycleHistorySerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     flow_logs = FlowIntensityLogSerializer(many=True, read_only=True)
     avg_flow_intensity = serializers.FloatField(read_only=True)
 
     class Meta:
         model = MenstrualCycleHistory
-        fields = ['id', 'user', 'related_cycle', 'menstruation_start', 'menstruation_end', 'cycle_length', 'flow_logs', 'symptoms', 'avg_flow_intensity']
+        fields = ['id', 'user', 'related_cycle', 'start_date', 'end_date', 'cycle_length', 'flow_logs', 'symptoms', 'avg_flow_intensity']
 
     def create(self, validated_data):
         flow_logs = validated_data.get('flow_logs', [])
@@ -106,7 +115,7 @@ class MenstrualCycleHistorySerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 # FlowIntensityLog Serializer
-class FlowIntensityLogSerializer(serializers.ModelSerializer):
+class FlowIntensityLogSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     cycle_duration = serializers.IntegerField(read_only=True)
 
     class Meta:
@@ -122,7 +131,7 @@ class FlowIntensityLogSerializer(serializers.ModelSerializer):
         return super().create(validated_data)
 
 # Prediction Serializer
-class PredictionSerializer(serializers.ModelSerializer):
+class PredictionSerializer(SparseFieldsetSerializerMixin, serializers.ModelSerializer):
     ovulation_prediction = serializers.DateField(read_only=True)
     next_period_prediction = serializers.DateField(read_only=True)
     ovulation_prediction_accuracy = serializers.FloatField(read_only=True)
@@ -146,4 +155,176 @@ class PredictionSerializer(serializers.ModelSerializer):
         validated_data['next_period_prediction'] = next_period_date
         validated_data['ovulation_prediction_accuracy'] = accuracy
 
-        return super().create(validated_data)
\ No newline at end of file
+        return super().create(validated_data)
+
+
+# Bulk import serializers for onboarding users with data from other trackers
+class BulkFlowLogEntrySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    intensity = serializers.ChoiceField(choices=FLOW_INTENSITY_CHOICES)
+
+
+class BulkCycleEntrySerializer(serializers.Serializer):
+    menstruation_start = serializers.DateField()
+    menstruation_end = serializers.DateField(required=False, allow_null=True)
+    flow_logs = BulkFlowLogEntrySerializer(many=True, required=False)
+
+    def validate(self, data):
+        end = data.get('menstruation_end')
+        if end and end < data['menstruation_start']:
+            raise serializers.ValidationError("menstruation_end must not be before menstruation_start.")
+
+        # Logs must fall within the cycle as it will be stored, with its derived cycle_end
+        cycle = MenstrualCycle(menstruation_start=data['menstruation_start'], menstruation_end=end)
+        cycle.apply_derived_fields()
+        outside = sorted(
+            str(log['date']) for log in data.get('flow_logs', [])
+            if not cycle.cycle_start <= log['date'] <= cycle.cycle_end
+        )
+        if outside:
+            raise serializers.ValidationError(
+                f"Flow logs must fall between {cycle.cycle_start} and {cycle.cycle_end}: {', '.join(outside)}."
+            )
+        return data
+
+
+class BulkImportSerializer(serializers.Serializer):
+    """
+    Import cycles with their flow logs.
+
+    Importing is idempotent: cycles are matched on their menstruation_start and flow logs
+    on their date, existing ones are updated instead of duplicated.
+    """
+
+    MAX_CYCLES = 5000  # Upper bound for a single import request
+    MAX_FLOW_LOGS = 20000  # Upper bound for the flow logs of all cycles of a request
+    BATCH_SIZE = 500
+    CYCLE_FIELDS = [  # Written when an already imported cycle is imported again
+        'menstruation_end', 'menstruation_duration', 'cycle_length', 'cycle_start', 'cycle_end',
+        'ovulation_date', 'ovulation_window_start', 'ovulation_window_end',
+    ]
+
+    cycles = BulkCycleEntrySerializer(many=True, allow_empty=False)
+
+    def validate_cycles(self, value):
+        if len(value) > self.MAX_CYCLES:
+            raise serializers.ValidationError(f"At most {self.MAX_CYCLES} cycles can be imported at once.")
+        if sum(len(entry.get('flow_logs', [])) for entry in value) > self.MAX_FLOW_LOGS:
+            raise serializers.ValidationError(f"At most {self.MAX_FLOW_LOGS} flow logs can be imported at once.")
+
+        starts = [entry['menstruation_start'] for entry in value]
+        days = [log['date'] for entry in value for log in entry.get('flow_logs', [])]
+        for name, dates in (('menstruation_start', starts), ('flow log date', days)):
+            duplicates = sorted(str(day) for day, count in Counter(dates).items() if count > 1)
+            if duplicates:
+                raise serializers.ValidationError(f"Duplicate {name}: {', '.join(duplicates)}.")
+        return value
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        entries = validated_data['cycles']
+        starts = [entry['menstruation_start'] for entry in entries]
+
+        with transaction.atomic():
+            # Cycles imported before are matched on their start, so the same import can be sent again
+            existing = {
+                cycle.menstruation_start: cycle
+                for cycle in MenstrualCycle.objects.filter(
+                    user=user, menstruation_start__range=(min(starts), max(starts))
+                )
+            }
+
+            # Derive cycle_end, ovulation date and window for the whole batch before writing
+            cycles, new_cycles, changed_cycles = [], [], []
+            now = timezone.now()
+            for entry in entries:
+                cycle = existing.get(entry['menstruation_start'])
+                if cycle is None:
+                    cycle = MenstrualCycle(user=user, menstruation_start=entry['menstruation_start'])
+                    new_cycles.append(cycle)
+                before = [getattr(cycle, field) for field in self.CYCLE_FIELDS]
+                cycle.menstruation_end = entry.get('menstruation_end')
+                cycle.apply_derived_fields()
+                if cycle.pk and [getattr(cycle, field) for field in self.CYCLE_FIELDS] != before:
+                    cycle.updated_at = now  # bulk_update does not apply auto_now
+                    changed_cycles.append(cycle)
+                cycles.append(cycle)
+
+            MenstrualCycle.objects.bulk_create(new_cycles, batch_size=self.BATCH_SIZE)
+            if changed_cycles:
+                MenstrualCycle.objects.bulk_update(
+                    changed_cycles, [*self.CYCLE_FIELDS, 'updated_at'], batch_size=self.BATCH_SIZE
+                )
+
+            flow_logs = [
+                FlowIntensityLog(user=user, cycle=cycle, date=log['date'], intensity=log['intensity'])
+                for cycle, entry in zip(cycles, entries)
+                for log in entry.get('flow_logs', [])
+            ]
+            # Re-imported days overwrite the existing log instead of violating the one-log-per-day constraint
+            flow_logs = FlowIntensityLog.upsert(flow_logs, batch_size=self.BATCH_SIZE)
+
+            # bulk_create skips the post_save handlers, so refresh derived state once for the batch
+            CycleStatistics.rebuild(user.id)
+            profile = UserProfile.objects.filter(user=user).first()
+            if profile:
+                profile.save()
+            bump_user_version(user.id)
+
+        return {'cycles': len(cycles), 'new_cycles': len(new_cycles), 'flow_logs': len(flow_logs)}
+
+
+# Batch upsert of daily flow logs, safe to resend after a failed or offline sync
+class FlowLogBatchEntrySerializer(serializers.Serializer):
+    cycle = serializers.IntegerField()
+    date = serializers.DateField()
+    intensity = serializers.ChoiceField(choices=FLOW_INTENSITY_CHOICES)
+
+
+class FlowLogBatchSerializer(serializers.Serializer):
+    MAX_ENTRIES = 366  # A year of daily logs per request
+
+    entries = FlowLogBatchEntrySerializer(many=True, allow_empty=False)
+
+    def validate_entries(self, value):
+        if len(value) > self.MAX_ENTRIES:
+            raise serializers.ValidationError(f"At most {self.MAX_ENTRIES} entries can be sent at once.")
+
+        cycle_ids = {entry['cycle'] for entry in value}
+        owned = set(
+            MenstrualCycle.objects.filter(user=self.context['request'].user, id__in=cycle_ids).values_list('id', flat=True)
+        )
+        if cycle_ids - owned:
+            raise serializers.ValidationError(f"Unknown cycles: {sorted(cycle_ids - owned)}.")
+        return value
+
+    def create(self, validated_data):
+        user = self.context['request'].user
+        return FlowIntensityLog.upsert([
+            FlowIntensityLog(user=user, cycle_id=entry['cycle'], date=entry['date'], intensity=entry['intensity'])
+            for entry in validated_data['entries']
+        ])
+
+
+# Calendar serializers
+class CalendarRangeSerializer(serializers.Serializer):
+    start = serializers.DateField()
+    end = serializers.DateField()
+
+    def validate(self, data):
+        if data['end'] < data['start']:
+            raise serializers.ValidationError("end must not be before start.")
+        if (data['end'] - data['start']).days >= MAX_RANGE_DAYS:
+            raise serializers.ValidationError(f"A calendar range can cover at most {MAX_RANGE_DAYS} days.")
+        return data
+
+
+class CalendarDaySerializer(serializers.Serializer):
+    date = serializers.DateField()
+    cycle = serializers.IntegerField(allow_null=True)
+    menstruation = serializers.BooleanField()
+    flow_intensity = serializers.CharField(allow_null=True)
+    ovulation = serializers.BooleanField()
+    fertile_window = serializers.BooleanField()
+    predicted_period = serializers.BooleanField()
+    predicted_ovulation = serializers.BooleanField()
@@ -0,0 +1,59 @@
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.contrib.auth.models import User
+from django.dispatch import receiver
+from django.utils import timezone
+from .authentication import user_cache
+from .caching import bump_user_version
+from .models import (
+    MenstrualCycle, CycleStatistics, FlowIntensityLog, MenstrualCycleHistory, Prediction, UserProfile, Tombstone
+)
+
+
+# Keep the per-user rolling cycle statistics in step with cycle writes
+@receiver(post_save, sender=MenstrualCycle)
+def update_cycle_statistics(sender, instance, created, **kwargs):
+    CycleStatistics.record_cycle(instance, created)
+
+
+@receiver(post_delete, sender=MenstrualCycle)
+def rebuild_cycle_statistics(sender, instance, origin=None, **kwargs):
+    # Deleting a user cascades to every cycle and to the statistics themselves, nothing to rebuild
+    if isinstance(origin, User) or getattr(origin, 'model', None) is User:
+        return
+    CycleStatistics.rebuild(instance.user_id)
+
+
+# Invalidate the user's cached responses whenever any of their data changes
+def invalidate_user_cache(sender, instance, **kwargs):
+    bump_user_version(instance.user_id)
+
+
+for model in (MenstrualCycle, FlowIntensityLog, MenstrualCycleHistory, Prediction, UserProfile):
+    post_save.connect(invalidate_user_cache, sender=model, dispatch_uid=f'mens1_cache_save_{model.__name__}')
+    post_delete.connect(invalidate_user_cache, sender=model, dispatch_uid=f'mens1_cache_delete_{model.__name__}')
+
+
+# Record deletions for delta sync clients
+def record_tombstone(sender, instance, **kwargs):
+    Tombstone.record(sender, [(instance.pk, instance.user_id)])
+
+
+for model in (MenstrualCycle, FlowIntensityLog, MenstrualCycleHistory, Prediction, UserProfile):
+    post_delete.connect(record_tombstone, sender=model, dispatch_uid=f'mens1_tombstone_{model.__name__}')
+
+
+@receiver(m2m_changed, sender=MenstrualCycleHistory.flow_logs.through)
+def invalidate_history_flow_logs(sender, instance, action, reverse, pk_set, **kwargs):
+    if action.startswith('post_'):
+        # The links are part of the history entry as far as sync clients are concerned
+        history_ids = list(pk_set or []) if reverse else [instance.pk]
+        if history_ids:
+            MenstrualCycleHistory.objects.filter(pk__in=history_ids).update(updated_at=timezone.now())
+        bump_user_version(instance.user_id)
+
+
+# Drop cached authentication users when their account changes
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
@@ -0,0 +1,129 @@
+"""
+Delta sync for offline clients.
+
+Every synced model carries ``updated_at`` (indexed together with the user) and
+deletions leave a Tombstone row. A sync token is a signed per-model keyset
+position (``updated_at``, ``id``); each call returns the rows changed after
+those positions, at most MENS1_SYNC_PAGE_SIZE per model, plus the ids deleted
+since the last call, so the work done depends only on the number of changes.
+
+Rows are only handed out once they are MENS1_SYNC_SETTLE_SECONDS old, so a
+transaction that commits late cannot slip in behind a position already
+returned. Tokens expire with the tombstones they rely on.
+"""
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core import signing
+from django.db.models import Q
+from django.utils import timezone
+from .models import UserProfile, MenstrualCycle, FlowIntensityLog, MenstrualCycleHistory, Prediction, Tombstone
+from .retention import flow_log_cutoff
+from .serializers import (
+    UserProfileSerializer,
+    MenstrualCycleSerializer,
+    FlowIntensityLogSerializer,
+    MenstrualCycleHistorySerializer,
+    PredictionSerializer,
+)
+
+TOKEN_SALT = 'Mens1.sync'
+TOMBSTONES = 'tombstones'
+
+# Response key, model, serializer, queryset tuning
+SYNC_MODELS = [
+    ('user_profiles', UserProfile, UserProfileSerializer, lambda qs: qs.select_related('user')),
+    ('menstrual_cycles', MenstrualCycle, MenstrualCycleSerializer, lambda qs: qs),
+    ('flow_intensity_logs', FlowIntensityLog, FlowIntensityLogSerializer, lambda qs: qs),
+    ('menstrual_cycle_history', MenstrualCycleHistory, MenstrualCycleHistorySerializer,
+     lambda qs: qs.prefetch_related('flow_logs')),
+    ('predictions', Prediction, PredictionSerializer, lambda qs: qs),
+]
+
+
+class SyncTokenError(Exception):
+    pass
+
+
+class SyncTokenExpired(SyncTokenError):
+    pass
+
+
+def dump_token(user_id, positions):
+    return signing.dumps({'u': user_id, 'p': positions}, salt=TOKEN_SALT, compress=True)
+
+
+def load_token(token, user_id):
+    """Return the positions stored in ``token``, checking it was issued to this user and is still usable."""
+    try:
+        payload = signing.loads(token, salt=TOKEN_SALT)
+    except signing.BadSignature:
+        raise SyncTokenError("Invalid sync token.")
+    if payload.get('u') != user_id:
+        raise SyncTokenError("Invalid sync token.")
+
+    positions = payload['p']
+    deleted_after = datetime.fromisoformat(positions[TOMBSTONES][0])
+    if deleted_after < timezone.now() - timedelta(days=settings.MENS1_TOMBSTONE_RETENTION_DAYS):
+        raise SyncTokenExpired("Sync token expired, start over with a full sync.")
+    return positions
+
+
+def after(queryset, field, position):
+    """Rows strictly after an (updated_at, id) keyset position."""
+    if not position:
+        return queryset
+    timestamp, pk = datetime.fromisoformat(position[0]), position[1]
+    return queryset.filter(Q(**{f'{field}__gt': timestamp}) | Q(**{field: timestamp, 'pk__gt': pk}))
+
+
+def changes_since(user, token=None, request=None, limit=None):
+    """
+    Return the sync payload for ``user``: changed rows per model, deleted ids per
+    model, whether more pages follow and the token for the next call.
+    """
+    limit = limit or settings.MENS1_SYNC_PAGE_SIZE
+    settled = timezone.now() - timedelta(seconds=settings.MENS1_SYNC_SETTLE_SECONDS)
+    positions = load_token(token, user.pk) if token else {}
+    context = {'request': request}
+    has_more = False
+
+    changes = {}
+    for key, model, serializer_class, tune in SYNC_MODELS:
+        queryset = after(model.objects.filter(user=user, updated_at__lte=settled), 'updated_at', positions.get(key))
+        rows = list(tune(queryset).order_by('updated_at', 'id')[:limit + 1])
+        if len(rows) > limit:
+            rows, has_more = rows[:limit], True
+        if rows:
+            positions[key] = [rows[-1].updated_at.isoformat(), rows[-1].pk]
+        changes[key] = serializer_class(rows, many=True, context=context).data
+
+    deleted = {key: [] for key, *_ in SYNC_MODELS}
+    if token:
+        keys = {model._meta.model_name: key for key, model, *_ in SYNC_MODELS}
+        queryset = after(
+            Tombstone.objects.filter(user_id=user.pk, deleted_at__lte=settled), 'deleted_at', positions[TOMBSTONES]
+        )
+        tombstones = list(queryset.order_by('deleted_at', 'id').values_list('id', 'model', 'object_id', 'deleted_at')[:limit + 1])
+        truncated = len(tombstones) > limit
+        if truncated:
+            tombstones, has_more = tombstones[:limit], True
+        for _, model_name, object_id, _ in tombstones:
+            if model_name in keys:
+                deleted[keys[model_name]].append(object_id)
+        if truncated or (tombstones and tombstones[-1][3] >= settled):
+            positions[TOMBSTONES] = [tombstones[-1][3].isoformat(), tombstones[-1][0]]
+        else:
+            # Every deletion up to ``settled`` was handed out, move on even when there were none
+            # so the token of a client that keeps syncing never expires
+            positions[TOMBSTONES] = [settled.isoformat(), 0]
+    else:
+        # A full sync has nothing to delete, only deletions from now on matter
+        positions[TOMBSTONES] = [settled.isoformat(), 0]
+
+    return {
+        'changes': changes,
+        'deleted': deleted,
+        'flow_log_cutoff': flow_log_cutoff(),  # Older flow logs are purged without tombstones
+        'has_more': has_more,
+        'next': dump_token(user.pk, positions),
+    }
@@ -0,0 +1,161 @@
+"""
+Synthetic data generator for load tests and benchmarks.
+
+Creates users with realistic cycle histories: every user gets a personal base
+cycle length and period duration with some day-to-day jitter, a share of users
+is irregular. Flow logs, history entries, cycle statistics, profiles and
+predictions are derived from the generated cycles. Everything is written with
+bulk queries, one transaction per batch of users, so the same seed always
+produces the same data.
+"""
+import random
+from datetime import timedelta
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.utils import timezone
+from .caching import bump_user_version
+from .models import (
+    CycleStatistics, FlowIntensityLog, MenstrualCycle, MenstrualCycleHistory, UserProfile
+)
+from .predictions import refresh_predictions
+
+DEFAULT_PASSWORD = 'benchmark-password'
+IRREGULAR_SHARE = 0.15  # Share of users with large cycle length variations
+FLOW_PATTERN = ['heavy', 'heavy', 'medium', 'medium', 'light', 'light', 'light']  # Intensity by period day
+
+
+def next_user_index(prefix):
+    """Return the first free index for usernames starting with ``prefix``."""
+    return User.objects.filter(username__startswith=prefix).count()
+
+
+def user_cycles(rng, user, cycle_count, today):
+    """Build unsaved cycles for one user, oldest first, the newest one started recently."""
+    base_length = rng.randint(24, 35)
+    jitter = rng.randint(5, 10) if rng.random() < IRREGULAR_SHARE else rng.randint(0, 2)
+    duration = rng.randint(3, 7)
+
+    lengths = [max(18, base_length + rng.randint(-jitter, jitter)) for _ in range(cycle_count)]
+    start = today - timedelta(days=rng.randint(0, base_length - 1) + sum(lengths[:-1]))
+
+    cycles = []
+    for length in lengths:
+        cycle = MenstrualCycle(
+            user=user,
+            menstruation_start=start,
+            menstruation_end=start + timedelta(days=max(2, duration + rng.randint(-1, 1))),
+        )
+        cycle.apply_derived_fields()
+        cycles.append(cycle)
+        start += timedelta(days=length)
+    return cycles
+
+
+def cycle_flow_logs(cycle):
+    """Build one flow log per menstruation day of the cycle."""
+    return [
+        FlowIntensityLog(
+            user_id=cycle.user_id,
+            cycle=cycle,
+            date=cycle.menstruation_start + timedelta(days=day),
+            intensity=FLOW_PATTERN[min(day, len(FLOW_PATTERN) - 1)],
+        )
+        for day in range(cycle.menstruation_duration)
+    ]
+
+
+def generate_batch(rng, usernames, password_hash, cycles_per_user, flow_log_cycles, today, batch_size=1000):
+    """Create the users in ``usernames`` and all their related rows. Returns a dict of row counts."""
+    counts = dict.fromkeys(['users', 'cycles', 'flow_logs', 'history', 'predictions'], 0)
+
+    with transaction.atomic():
+        users = User.objects.bulk_create(
+            [User(username=name, email=f"{name}@example.com", password=password_hash) for name in usernames],
+            batch_size=batch_size,
+        )
+
+        user_cycle_lists = [user_cycles(rng, user, cycles_per_user, today) for user in users]
+        cycles = [cycle for user_cycle_list in user_cycle_lists for cycle in user_cycle_list]
+        MenstrualCycle.objects.bulk_create(cycles, batch_size=batch_size)
+
+        flow_logs, logs_by_cycle = [], {}
+        for user_cycle_list in user_cycle_lists:
+            for cycle in user_cycle_list[-flow_log_cycles:] if flow_log_cycles else []:
+                logs_by_cycle[cycle] = cycle_flow_logs(cycle)
+                flow_logs.extend(logs_by_cycle[cycle])
+        FlowIntensityLog.objects.bulk_create(flow_logs, batch_size=batch_size)
+
+        # Completed cycles go to the history, the newest one is still running
+        history = []
+        for user_cycle_list in user_cycle_lists:
+            completed = user_cycle_list[:-1][-MenstrualCycleHistory.MAX_HISTORY_ENTRIES:]
+            for cycle, next_cycle in zip(completed, user_cycle_list[1:]):
+                history.append(MenstrualCycleHistory(
+                    user_id=cycle.user_id,
+                    related_cycle=cycle,
+                    start_date=cycle.menstruation_start,
+                    end_date=next_cycle.menstruation_start - timedelta(days=1),
+                    cycle_length=(next_cycle.menstruation_start - cycle.menstruation_start).days - 1,
+                ))
+        MenstrualCycleHistory.objects.bulk_create(history, batch_size=batch_size)
+
+        through = MenstrualCycleHistory.flow_logs.through
+        through.objects.bulk_create(
+            [
+                through(menstrualcyclehistory_id=entry.pk, flowintensitylog_id=log.pk)
+                for entry in history
+                for log in logs_by_cycle.get(entry.related_cycle, [])
+            ],
+            batch_size=batch_size,
+        )
+
+        # bulk_create skips save() and the signal handlers, derive statistics and profiles here
+        statistics, profiles = [], []
+        for user, user_cycle_list in zip(users, user_cycle_lists):
+            stats = CycleStatistics(user=user, recent_lengths=[], length_sum=0)
+            for cycle in user_cycle_list[-CycleStatistics.WINDOW_SIZE:]:
+                stats.push_cycle(cycle)
+            statistics.append(stats)
+
+            profile = UserProfile(user=user, birthdate=today - timedelta(days=rng.randint(18 * 365, 45 * 365)))
+            profile.apply_cycle_statistics(stats, today)
+            profiles.append(profile)
+        CycleStatistics.objects.bulk_create(statistics, batch_size=batch_size)
+        UserProfile.objects.bulk_create(profiles, batch_size=batch_size)
+
+    if users:
+        created, _ = refresh_predictions(users[0].pk, users[-1].pk + 1)
+        counts['predictions'] = created
+        bump_user_version(*[user.pk for user in users])
+
+    counts.update(users=len(users), cycles=len(cycles), flow_logs=len(flow_logs), history=len(history))
+    return counts
+
+
+def generate(user_count, cycles_per_user=12, flow_log_cycles=3, batch_users=1000, seed=0,
+             prefix='synthetic-', password=DEFAULT_PASSWORD, today=None, progress=None):
+    """
+    Create ``user_count`` synthetic users, ``batch_users`` at a time.
+
+    ``flow_log_cycles`` limits flow logs to each user's most recent cycles, like the
+    retention policy does in production. Returns a dict of created row counts.
+    """
+    today = today or timezone.now().date()
+    password_hash = make_password(password)  # Hashing is slow on purpose, do it once for every user
+    first_index = next_user_index(prefix)
+    totals = dict.fromkeys(['users', 'cycles', 'flow_logs', 'history', 'predictions'], 0)
+
+    for offset in range(0, user_count, batch_users):
+        start = first_index + offset
+        end = first_index + min(offset + batch_users, user_count)
+        rng = random.Random(f"{seed}:{start}")  # Batches are reproducible independently of each other
+        counts = generate_batch(
+            rng, [f"{prefix}{index}" for index in range(start, end)], password_hash,
+            cycles_per_user, flow_log_cycles, today,
+        )
+        for key, value in counts.items():
+            totals[key] += value
+        if progress:
+            progress(end - first_index, counts)
+    return totals
@@ -0,0 +1,138 @@
+import uuid
+from datetime import timedelta
+from celery import shared_task
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import OutboundEmail, MenstrualCycleHistory, UserProfile, Tombstone
+from .analytics import refresh_analytics
+from .predictions import refresh_predictions, user_id_ranges
+from .retention import flow_log_cutoff, purge_flow_logs
+
+CLAIM_TIMEOUT = timedelta(minutes=10)  # Rows claimed by a worker that died are retried after this
+
+
+def claim_outbound_emails(batch_size):
+    """Atomically mark a batch of pending emails as owned by this worker and return them."""
+    stale = timezone.now() - CLAIM_TIMEOUT
+    candidates = OutboundEmail.objects.filter(
+        Q(status='pending') | Q(status='sending', claimed_at__lt=stale)
+    ).order_by('id').values_list('id', flat=True)[:batch_size]
+
+    token = uuid.uuid4()
+    OutboundEmail.objects.filter(
+        Q(status='pending') | Q(status='sending', claimed_at__lt=stale), id__in=list(candidates)
+    ).update(status='sending', claim_token=token, claimed_at=timezone.now())
+    return list(OutboundEmail.objects.filter(claim_token=token, status='sending'))
+
+
+@shared_task(bind=True, max_retries=5, default_retry_delay=30)
+def deliver_outbound_emails(self):
+    """Send pending outbox emails over a single SMTP connection per batch."""
+    emails = claim_outbound_emails(settings.OUTBOUND_EMAIL_BATCH_SIZE)
+    if not emails:
+        return 0
+
+    sent_ids, failures = [], {}
+    try:
+        connection = get_connection(fail_silently=False)
+        connection.open()
+    except Exception as exc:
+        # Release the whole batch, otherwise it stays claimed until CLAIM_TIMEOUT
+        failures = {email.id: str(exc) for email in emails}
+    else:
+        with connection:
+            for email in emails:
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email or None, [email.recipient], connection=connection
+                )
+                try:
+                    message.send()
+                    sent_ids.append(email.id)
+                except Exception as exc:
+                    failures[email.id] = str(exc)
+
+    OutboundEmail.objects.filter(id__in=sent_ids).update(
+        status='sent', sent_at=timezone.now(), attempts=F('attempts') + 1, claim_token=None
+    )
+    for email_id, error in failures.items():
+        OutboundEmail.objects.filter(id=email_id).update(
+            status='pending', attempts=F('attempts') + 1, last_error=error, claim_token=None
+        )
+    OutboundEmail.objects.filter(
+        id__in=failures, attempts__gte=settings.OUTBOUND_EMAIL_MAX_ATTEMPTS
+    ).update(status='failed')
+
+    # Eager runs leave failed rows to the periodic beat task instead of retrying inside the request
+    if failures and not self.request.is_eager:
+        raise self.retry(countdown=self.default_retry_delay * (self.request.retries + 1))
+    return len(sent_ids)
+
+
+def queue_email(subject, body, from_email, recipient):
+    """
+    Store an email in the outbox and schedule delivery once the current transaction commits.
+
+    Without a broker (eager mode) delivery would run inside the request, so the email is
+    left to the periodic sender instead, see the send_outbound_emails command.
+    """
+    email = OutboundEmail.objects.create(
+        subject=subject, body=body, from_email=from_email or '', recipient=recipient
+    )
+    if not settings.CELERY_TASK_ALWAYS_EAGER:
+        transaction.on_commit(deliver_outbound_emails.delay, robust=True)
+    return email
+
+
+@shared_task
+def purge_old_flow_logs():
+    """Scheduled flow log retention, see the purge_flow_logs management command."""
+    deleted, _ = purge_flow_logs(flow_log_cutoff())
+    return deleted
+
+
+@shared_task
+def purge_tombstones():
+    """Drop tombstones older than the sync token lifetime, clients that old resync from scratch."""
+    cutoff = timezone.now() - timedelta(days=settings.MENS1_TOMBSTONE_RETENTION_DAYS)
+    deleted, _ = Tombstone.objects.filter(deleted_at__lt=cutoff).delete()
+    return deleted
+
+
+@shared_task
+def trim_cycle_history(user_ids=None):
+    """Enforce the per-user history cap, for the given users or for everyone."""
+    return MenstrualCycleHistory.trim_overflow(user_ids)
+
+
+@shared_task
+def refresh_prediction_chunk(start_user_id, end_user_id):
+    created, updated = refresh_predictions(start_user_id, end_user_id)
+    return created + updated
+
+
+@shared_task
+def refresh_all_predictions(chunk_size=5000):
+    """Fan out one prediction refresh task per range of user ids."""
+    for start, end in user_id_ranges(chunk_size):
+        refresh_prediction_chunk.delay(start, end)
+
+
+@shared_task
+def refresh_profile_chunk(start_user_id, end_user_id):
+    return UserProfile.refresh_time_dependent_fields(start_user_id, end_user_id)
+
+
+@shared_task
+def refresh_all_profiles(chunk_size=5000):
+    """Fan out one task per range of user ids to roll profile status fields over to the new day."""
+    for start, end in user_id_ranges(chunk_size):
+        refresh_profile_chunk.delay(start, end)
+
+
+@shared_task
+def refresh_population_analytics():
+    """Apply the cycle, profile and prediction changes since the last run to the analytics histograms."""
+    return refresh_analytics()
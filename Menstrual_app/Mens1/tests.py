@@ -1,3 +1,997 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from unittest import mock
+import jwt
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import caches
+from django.apps import apps
+from django.db import connection, connections, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+from .admin import EstimatedCountPaginator
+from .analytics import STATE_KEY, histogram_report, refresh_analytics
+from rest_framework.exceptions import AuthenticationFailed
+from .authentication import CachedJWTAuthentication, UserCache, user_cache
+from .benchmark import ClientTransport, run_benchmark
+from .caching import get_cache, get_user_version
+from .checks import check_throttle_store
+from .replicas import REPLICA_ALIAS
+from .prediction_cache import PredictionBundleCache, get_prediction_bundle, prediction_cache
+from .predictions import refresh_predictions
+from .profiling import hot_functions
+from .models import (
+    AnalyticsState, CycleStatistics, FlowIntensityLog, MenstrualCycle, MenstrualCycleHistory, OutboundEmail, Prediction,
+    ThrottleCounter, Tombstone, UserProfile,
+)
+from .serializers import BulkImportSerializer
+from .synthetic import DEFAULT_PASSWORD, generate
+from .tasks import deliver_outbound_emails, queue_email
+from .throttling import SlidingWindowUserRateThrottle
 
-# Create your tests here.
+
+class SyntheticDataTests(TestCase):
+    def test_generate_creates_consistent_users(self):
+        totals = generate(3, cycles_per_user=8, flow_log_cycles=2, batch_users=2, seed=1)
+
+        self.assertEqual(totals['users'], 3)
+        self.assertEqual(MenstrualCycle.objects.count(), 24)
+        self.assertEqual(MenstrualCycleHistory.objects.count(), 21)
+        self.assertEqual(FlowIntensityLog.objects.count(), totals['flow_logs'])
+        self.assertEqual(UserProfile.objects.count(), 3)
+        self.assertEqual(Prediction.objects.count(), 3)
+
+        for user in User.objects.filter(username__startswith='synthetic-'):
+            stats = CycleStatistics.objects.get(user=user)
+            latest = MenstrualCycle.objects.filter(user=user).order_by('-menstruation_start').first()
+            self.assertEqual(stats.last_cycle_id, latest.id)
+            self.assertEqual(len(stats.recent_lengths), CycleStatistics.WINDOW_SIZE)
+
+    def test_generate_is_reproducible(self):
+        generate(2, seed=7, prefix='a-')
+        generate(2, seed=7, prefix='b-')
+        starts = [
+            list(MenstrualCycle.objects.filter(user__username=name).order_by('id').values_list('menstruation_start', flat=True))
+            for name in ('a-0', 'b-0')
+        ]
+        self.assertEqual(starts[0], starts[1])
+
+
+class CycleStatisticsTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('stats', 'stats@example.com', DEFAULT_PASSWORD)
+
+    def add_cycle(self, start, days):
+        return MenstrualCycle.objects.create(
+            user=self.user, menstruation_start=start, menstruation_end=start + timedelta(days=days)
+        )
+
+    def assertMatchesFreshAggregate(self):
+        last_cycles = MenstrualCycle.objects.filter(user=self.user).order_by('-menstruation_start')
+        lengths = [(cycle.menstruation_end - cycle.menstruation_start).days for cycle in last_cycles[:6]]
+        stats = CycleStatistics.objects.get(user=self.user)
+        self.assertEqual(stats.recent_lengths, lengths)
+        self.assertEqual(stats.average_length, sum(lengths) // len(lengths) if lengths else None)
+        self.assertEqual(stats.last_cycle_id, last_cycles[0].id if lengths else None)
+
+    def test_ring_buffer_matches_fresh_aggregate(self):
+        start = date(2024, 1, 1)
+        for n, days in enumerate([3, 5, 7, 4, 6, 5, 8, 3, 4]):
+            self.add_cycle(start + timedelta(days=30 * n), days)
+            self.assertMatchesFreshAggregate()
+
+        self.add_cycle(start - timedelta(days=30), 9)  # Out of order, outside the window
+        self.assertMatchesFreshAggregate()
+        latest = MenstrualCycle.objects.filter(user=self.user).latest('menstruation_start')
+        latest.menstruation_end = latest.menstruation_start + timedelta(days=6)
+        latest.save()
+        self.assertMatchesFreshAggregate()
+        latest.delete()
+        self.assertMatchesFreshAggregate()
+
+        CycleStatistics.objects.filter(user=self.user).update(recent_lengths=[1], length_sum=1)
+        CycleStatistics.rebuild(self.user.pk)
+        self.assertMatchesFreshAggregate()
+
+        MenstrualCycle.objects.filter(user=self.user).delete()
+        CycleStatistics.rebuild(self.user.pk)
+        self.assertMatchesFreshAggregate()
+
+    def test_deleting_the_user_skips_the_rebuilds(self):
+        for n in range(3):
+            cycle = self.add_cycle(date(2024, 1, 1) + timedelta(days=30 * n), 5)
+        other = User.objects.create_user('other', 'other@example.com', DEFAULT_PASSWORD)
+        MenstrualCycle.objects.create(user=other, menstruation_start=date(2024, 1, 1))
+
+        with mock.patch.object(CycleStatistics, 'rebuild') as rebuild:
+            cycle.delete()
+            rebuild.assert_called_once_with(self.user.pk)
+
+            rebuild.reset_mock()
+            User.objects.get(pk=self.user.pk).delete()
+            User.objects.filter(pk=other.pk).delete()
+            rebuild.assert_not_called()
+        self.assertFalse(MenstrualCycle.objects.exists())
+
+    def test_profile_of_user_without_cycles_reads_statistics_once_created(self):
+        profile = UserProfile.objects.create(user=self.user)
+        self.assertTrue(CycleStatistics.objects.filter(user=self.user).exists())
+
+        with CaptureQueriesContext(connection) as queries:
+            profile.save()
+        self.assertFalse(any('mens1_menstrualcycle' in query['sql'].lower() for query in queries.captured_queries))
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class BenchmarkTests(TestCase):
+    def test_report_has_latency_percentiles(self, allow_request):
+        generate(2, cycles_per_user=4)
+        report = run_benchmark(
+            ClientTransport(), ['synthetic-0', 'synthetic-1'], requests=5, concurrency=1, warmup=1,
+            scenarios=['token-refresh', 'menstrual-cycle-list', 'calendar'],
+        )
+
+        self.assertEqual(set(report['endpoints']), {'token-refresh', 'menstrual-cycle-list', 'calendar'})
+        for result in report['endpoints'].values():
+            self.assertEqual(result['status_counts'], {'200': 5})
+            self.assertEqual(set(result['latency_ms']), {'mean', 'p50', 'p95', 'p99', 'max'})
+            self.assertGreater(result['throughput_rps'], 0)
+
+
+class OutboundEmailTests(TestCase):
+    def test_connection_failure_releases_the_batch(self):
+        queue_email("Subject", "Body", '', 'user@example.com')
+        with mock.patch('Mens1.tasks.get_connection', side_effect=ConnectionRefusedError("down")):
+            self.assertEqual(deliver_outbound_emails.apply().get(), 0)
+
+        email = OutboundEmail.objects.get()
+        self.assertEqual((email.status, email.attempts, email.claim_token), ('pending', 1, None))
+        self.assertIn("down", email.last_error)
+
+        self.assertEqual(deliver_outbound_emails.apply().get(), 1)
+        self.assertEqual(OutboundEmail.objects.get().status, 'sent')
+
+    def test_eager_mode_leaves_delivery_to_the_periodic_sender(self):
+        with mock.patch('Mens1.tasks.deliver_outbound_emails.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                queue_email("Subject", "Body", '', 'user@example.com')
+        delay.assert_not_called()
+        self.assertEqual(OutboundEmail.objects.get().status, 'pending')
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.aallow_request', return_value=True)
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        generate(1, cycles_per_user=3)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(User.objects.get(username='synthetic-0'))}"}
+
+    def test_cursor_pagination(self, aallow_request):
+        first = self.client.get('/api/async/menstrual-cycles/', {'page_size': 2}, headers=self.headers).json()
+        second = self.client.get(first['next'], headers=self.headers).json()
+        self.assertEqual(len(first['results']) + len(second['results']), 3)
+        self.assertIsNone(second['next'])
+
+    def test_malformed_cursor_is_400(self, aallow_request):
+        for path, cursor in [
+            ('/api/async/menstrual-cycles/', 'abc'),
+            ('/api/async/menstrual-cycles/', '2024-01-01:'),
+            ('/api/async/predictions/', '2024-01-01'),
+        ]:
+            response = self.client.get(path, {'cursor': cursor}, headers=self.headers)
+            self.assertEqual(response.status_code, 400, cursor)
+            self.assertEqual(response.json(), {"detail": "Invalid cursor."})
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        generate(2, cycles_per_user=4)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', DEFAULT_PASSWORD))
+
+    def test_changelists_and_date_hierarchies(self):
+        for model, date_field in [
+            ('userprofile', None), ('menstrualcycle', 'menstruation_start'), ('flowintensitylog', 'date'),
+            ('menstrualcyclehistory', 'start_date'), ('prediction', 'next_period_prediction'),
+        ]:
+            with self.subTest(model=model):
+                self.assertEqual(self.client.get(f'/admin/Mens1/{model}/').status_code, 200)
+                if date_field:
+                    response = self.client.get(f'/admin/Mens1/{model}/', {f'{date_field}__year': 2024})
+                    self.assertEqual(response.status_code, 200)
+
+    def test_count_is_bounded(self):
+        with mock.patch.object(EstimatedCountPaginator, 'EXACT_COUNT_LIMIT', 3):
+            with CaptureQueriesContext(connection) as queries:
+                paginator = EstimatedCountPaginator(MenstrualCycle.objects.order_by('id'), 2)
+                self.assertEqual(paginator.count, 4)
+        self.assertIn('LIMIT 4', queries.captured_queries[0]['sql'])
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class BulkImportTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('importer', 'importer@example.com', DEFAULT_PASSWORD)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def post(self, cycles, status_code):
+        response = self.client.post(
+            '/api/import/', {'cycles': cycles}, content_type='application/json', headers=self.headers
+        )
+        self.assertEqual(response.status_code, status_code, response.content)
+        return response.json()
+
+    def cycles(self, end_day=5):
+        return [
+            {
+                'menstruation_start': str(date(2024, month, 1)),
+                'menstruation_end': str(date(2024, month, end_day)),
+                'flow_logs': [{'date': str(date(2024, month, day)), 'intensity': 'medium'} for day in (1, 2)],
+            }
+            for month in (1, 2, 3)
+        ]
+
+    def test_importing_again_updates_instead_of_duplicating(self, allow_request):
+        self.assertEqual(self.post(self.cycles(), 201)['imported'], {'cycles': 3, 'new_cycles': 3, 'flow_logs': 6})
+        stored = MenstrualCycle.objects.filter(user=self.user).order_by('id').values_list('id', 'updated_at')
+        before = list(stored)
+
+        self.assertEqual(self.post(self.cycles(), 201)['imported']['new_cycles'], 0)
+        self.assertEqual(list(stored), before)
+        self.assertEqual(FlowIntensityLog.objects.filter(user=self.user).count(), 6)
+
+        self.post(self.cycles(end_day=6), 201)
+        self.assertEqual(
+            set(MenstrualCycle.objects.filter(user=self.user).values_list('menstruation_duration', flat=True)), {5}
+        )
+        self.assertEqual(MenstrualCycle.objects.filter(user=self.user).count(), 3)
+
+    def test_rejects_inconsistent_payloads(self, allow_request):
+        outside = self.cycles()
+        outside[0]['flow_logs'].append({'date': '2023-12-31', 'intensity': 'light'})
+        duplicate_days = self.cycles()
+        duplicate_days[1]['flow_logs'].append(duplicate_days[1]['flow_logs'][0])
+        duplicate_starts = self.cycles() + self.cycles()[:1]
+        for cycles in (outside, duplicate_days, duplicate_starts):
+            self.post(cycles, 400)
+
+        with mock.patch.object(BulkImportSerializer, 'MAX_FLOW_LOGS', 5):
+            self.post(self.cycles(), 400)
+        self.assertFalse(MenstrualCycle.objects.filter(user=self.user).exists())
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class ExportTests(TestCase):
+    def setUp(self):
+        generate(2, cycles_per_user=3)
+        self.user = User.objects.get(username='synthetic-0')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def test_csv_export_streams_only_own_rows(self, allow_request):
+        response = self.client.get('/api/export/cycles.csv', headers=self.headers)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'user_id', 'menstruation_start'])
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(all(line.split(',')[1] == str(self.user.pk) for line in lines[1:]))
+
+    def test_gzipped_ndjson_export(self, allow_request):
+        response = self.client.get('/api/export/flow-logs.ndjson?gzip=1', headers=self.headers)
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        records = [json.loads(line) for line in gzip.decompress(b''.join(response.streaming_content)).splitlines()]
+        self.assertEqual(len(records), FlowIntensityLog.objects.filter(user=self.user).count())
+
+    def test_unknown_dataset_is_404(self, allow_request):
+        response = self.client.get('/api/export/users.csv', headers=self.headers)
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(MENS1_SYNC_SETTLE_SECONDS=0)
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class SyncTests(TestCase):
+    def setUp(self):
+        generate(2, cycles_per_user=4)
+        self.user = User.objects.get(username='synthetic-0')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def sync(self, since=None, status_code=200):
+        response = self.client.get('/api/sync/', {'since': since} if since else {}, headers=self.headers)
+        self.assertEqual(response.status_code, status_code)
+        return response.json()
+
+    def test_full_sync_then_only_changes(self, allow_request):
+        full = self.sync()
+        self.assertEqual(len(full['changes']['menstrual_cycles']), 4)
+        self.assertEqual(len(full['changes']['user_profiles']), 1)
+        self.assertFalse(full['has_more'])
+
+        self.assertEqual(sum(map(len, self.sync(full['next'])['changes'].values())), 0)
+
+        cycle = MenstrualCycle.objects.filter(user=self.user).order_by('id').first()
+        cycle.save()
+        log = FlowIntensityLog.objects.filter(user=self.user).first()
+        log_id = log.id
+        log.delete()
+
+        delta = self.sync(full['next'])
+        self.assertEqual([row['id'] for row in delta['changes']['menstrual_cycles']], [cycle.id])
+        self.assertEqual(delta['changes']['predictions'], [])
+        self.assertEqual(delta['deleted']['flow_intensity_logs'], [log_id])
+
+    def test_regular_syncs_without_deletions_do_not_expire(self, allow_request):
+        token = self.sync()['next']
+        now = timezone.now()
+        for days in (20, 40, 60):
+            with mock.patch('django.utils.timezone.now', return_value=now + timedelta(days=days)):
+                token = self.sync(token)['next']
+
+        with mock.patch('django.utils.timezone.now', return_value=now + timedelta(days=100)):
+            self.sync(token, status_code=410)
+
+    def test_pages_through_large_changesets(self, allow_request):
+        with override_settings(MENS1_SYNC_PAGE_SIZE=3):
+            first = self.sync()
+            self.assertTrue(first['has_more'])
+            second = self.sync(first['next'])
+        ids = [row['id'] for page in (first, second) for row in page['changes']['menstrual_cycles']]
+        self.assertEqual(sorted(ids), list(MenstrualCycle.objects.filter(user=self.user).values_list('id', flat=True)))
+
+    def test_trimmed_history_is_reported_as_deleted(self, allow_request):
+        token = self.sync()['next']
+        with mock.patch.object(MenstrualCycleHistory, 'MAX_HISTORY_ENTRIES', 1):
+            MenstrualCycleHistory.trim_overflow([self.user.pk])
+
+        delta = self.sync(token)
+        self.assertEqual(len(delta['deleted']['menstrual_cycle_history']), 2)
+        self.assertEqual(Tombstone.objects.filter(user_id=self.user.pk).count(), 2)
+
+    def test_rejects_tokens_of_other_users(self, allow_request):
+        other = User.objects.get(username='synthetic-1')
+        token = self.client.get(
+            '/api/sync/', headers={'Authorization': f"Bearer {AccessToken.for_user(other)}"}
+        ).json()['next']
+        self.sync(token, status_code=400)
+        self.sync('garbage', status_code=400)
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class FlowLogBatchTests(TestCase):
+    def setUp(self):
+        generate(2, cycles_per_user=2, flow_log_cycles=0)
+        self.user = User.objects.get(username='synthetic-0')
+        self.cycle = MenstrualCycle.objects.filter(user=self.user).latest('menstruation_start')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def post(self, entries):
+        return self.client.post(
+            '/api/flow-intensity-logs/batch/', {'entries': entries}, content_type='application/json', headers=self.headers
+        )
+
+    def test_resending_is_idempotent(self, allow_request):
+        start = self.cycle.menstruation_start
+        entries = [
+            {'cycle': self.cycle.id, 'date': str(start + timedelta(days=day)), 'intensity': 'medium'} for day in range(5)
+        ]
+        first = self.post(entries)
+        stored = dict(FlowIntensityLog.objects.filter(user=self.user).values_list('id', 'updated_at'))
+        version = get_user_version(self.user.pk)
+        second = self.post(entries)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertTrue(all(row['id'] for row in first.json()['results']))
+        self.assertEqual(first.json()['results'], second.json()['results'])
+        self.assertEqual(dict(FlowIntensityLog.objects.filter(user=self.user).values_list('id', 'updated_at')), stored)
+        self.assertEqual(get_user_version(self.user.pk), version)
+
+        entries[0]['intensity'] = 'heavy'
+        self.post(entries[:1])
+        self.assertEqual(FlowIntensityLog.objects.get(user=self.user, date=start).intensity, 'heavy')
+        self.assertEqual(FlowIntensityLog.objects.filter(user=self.user).count(), 5)
+
+    def test_rejects_cycles_of_other_users(self, allow_request):
+        other_cycle = MenstrualCycle.objects.exclude(user=self.user).first()
+        response = self.post([{'cycle': other_cycle.id, 'date': '2024-01-01', 'intensity': 'light'}])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(FlowIntensityLog.objects.exists())
+
+
+@override_settings(MENS1_SYNC_SETTLE_SECONDS=0)
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class AnalyticsTests(TestCase):
+    def setUp(self):
+        generate(5, cycles_per_user=6)
+
+    def totals(self, metric):
+        return sum(sum(values.values()) for values in histogram_report(metric).get(metric, {}).values())
+
+    def test_incremental_refresh_matches_rebuild(self, allow_request):
+        refresh_analytics()
+        self.assertEqual(self.totals('cycle_state'), 5)
+        self.assertEqual(self.totals('cycle_length'), 5 * 5)
+        self.assertEqual(self.totals('menstruation_duration'), 5 * 6)
+
+        user = User.objects.get(username='synthetic-0')
+        MenstrualCycle.objects.filter(user=user).order_by('menstruation_start').first().delete()
+        profile = UserProfile.objects.get(user__username='synthetic-1')
+        profile.birthdate = date(1950, 1, 1)
+        profile.save()
+        User.objects.get(username='synthetic-2').delete()
+
+        self.assertEqual(refresh_analytics(), 2)  # synthetic-2 has nothing left to contribute
+        incremental = histogram_report()
+        refresh_analytics(rebuild=True)
+        self.assertEqual(incremental, histogram_report())
+        self.assertEqual(self.totals('cycle_length'), 4 * 5 - 1)
+        self.assertIn('45+', incremental['cycle_state'])
+
+    def test_runs_do_not_overlap(self, allow_request):
+        self.assertEqual(refresh_analytics(chunk_size=2), 5)
+        AnalyticsState.objects.filter(key=STATE_KEY).update(running_since=timezone.now())
+        self.assertIsNone(refresh_analytics(rebuild=True))
+        self.assertEqual(self.totals('cycle_state'), 5)
+
+        AnalyticsState.objects.filter(key=STATE_KEY).update(running_since=timezone.now() - timedelta(hours=1))
+        self.assertEqual(refresh_analytics(rebuild=True, chunk_size=2), 5)
+        self.assertIsNone(AnalyticsState.objects.get(key=STATE_KEY).running_since)
+
+    def test_endpoint_is_staff_only(self, allow_request):
+        refresh_analytics()
+        user = User.objects.get(username='synthetic-0')
+        headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+        self.assertEqual(self.client.get('/api/analytics/', headers=headers).status_code, 403)
+
+        user.is_staff = True
+        user.save()
+        response = self.client.get('/api/analytics/', {'metric': 'cycle_state'}, headers=headers)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.json()['metrics']), ['cycle_state'])
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        user_cache.clear()
+        generate(1, cycles_per_user=3)
+        self.user = User.objects.get(username='synthetic-0')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def get(self, path='/api/menstrual-cycles/', **headers):
+        return self.client.get(path, headers={**self.headers, **headers})
+
+    def test_etag_revalidation_and_invalidation_after_writes(self, allow_request):
+        first = self.get()
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(set(first['Cache-Control'].split(', ')), {'private', 'no-cache'})
+        self.assertTrue(first['Last-Modified'])
+
+        with self.assertNumQueries(0):
+            not_modified = self.get(**{'If-None-Match': first['ETag']})
+            cached = self.get()
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+        self.assertEqual((cached['ETag'], cached.json()), (first['ETag'], first.json()))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            cycle = MenstrualCycle.objects.create(user=self.user, menstruation_start=date(2030, 1, 1))
+        changed = self.get(**{'If-None-Match': first['ETag']})
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+        self.assertEqual([row['id'] for row in changed.json()['results']][0], cycle.pk)
+
+    def test_reads_before_commit_are_not_served_after_it(self, allow_request):
+        with self.captureOnCommitCallbacks(execute=True):
+            MenstrualCycle.objects.filter(user=self.user).latest('menstruation_start').delete()
+            # Stands in for a concurrent request reading the rows from before the commit
+            before_commit = self.get()
+
+        after_commit = self.get(**{'If-None-Match': before_commit['ETag']})
+        self.assertEqual(after_commit.status_code, 200)
+        self.assertNotEqual(after_commit['ETag'], before_commit['ETag'])
+
+    def test_versions_outlive_cached_responses(self, allow_request):
+        first = self.get()
+        later = time.time() + settings.MENS1_CACHE_TIMEOUT + 3600
+        with mock.patch('time.time', return_value=later):
+            second = self.get(**{'If-None-Match': first['ETag']})
+            version, last_modified = get_user_version(self.user.pk)
+        self.assertEqual(second.status_code, 304)
+        self.assertEqual(second['Last-Modified'], first['Last-Modified'])
+        self.assertLess(last_modified, later - settings.MENS1_REPLICA_PIN_SECONDS)
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class ReplicaRoutingTests(TestCase):
+    """Reads against a second SQLite database standing in for the replica, holding different rows."""
+
+    def setUp(self):
+        get_cache().clear()
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        replica = {**connections['default'].settings_dict, 'NAME': os.path.join(directory.name, 'replica.sqlite3')}
+        for patch in (
+            mock.patch.dict(settings.DATABASES, {REPLICA_ALIAS: replica}),
+            # The alias only exists during the test, so it cannot be listed in the class's databases
+            mock.patch.object(type(self), 'databases', {'default', REPLICA_ALIAS}),
+        ):
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(self.drop_replica_connection)
+        with connections[REPLICA_ALIAS].schema_editor() as editor:
+            for model in apps.get_models():
+                editor.create_model(model)
+
+        self.user = User.objects.create_user('replicated', 'replicated@example.com', DEFAULT_PASSWORD)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        # bulk_create skips the signal handlers, which would write to the primary
+        User.objects.using(REPLICA_ALIAS).bulk_create([User(pk=self.user.pk, username=self.user.username)])
+        self.replica_cycle = MenstrualCycle.objects.using(REPLICA_ALIAS).bulk_create([
+            MenstrualCycle(pk=10 ** 6, user_id=self.user.pk, menstruation_start=date(2024, 1, 1))  # Unused on the primary
+        ])[0]
+        self.requests = 0
+
+    def drop_replica_connection(self):
+        connections[REPLICA_ALIAS].close()
+        del connections[REPLICA_ALIAS]
+
+    def cycle_ids(self, after=0):
+        """Cycles listed ``after`` seconds from now, every request bypasses the cached responses."""
+        self.requests += 1
+        with mock.patch('time.time', return_value=time.time() + after):
+            response = self.client.get('/api/menstrual-cycles/', {'request': self.requests}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return [cycle['id'] for cycle in response.json()['results']]
+
+    def test_reads_go_to_the_replica(self, allow_request):
+        get_user_version(self.user.pk)
+        self.assertEqual(self.cycle_ids(after=settings.MENS1_REPLICA_PIN_SECONDS + 1), [self.replica_cycle.pk])
+
+    def test_recent_writers_read_from_the_primary(self, allow_request):
+        with self.captureOnCommitCallbacks(execute=True):
+            cycle = MenstrualCycle.objects.create(user=self.user, menstruation_start=date(2024, 6, 1))
+        self.assertEqual(self.cycle_ids(), [cycle.pk])
+        self.assertEqual(self.cycle_ids(after=settings.MENS1_REPLICA_PIN_SECONDS + 1), [self.replica_cycle.pk])
+
+    def test_unsafe_methods_use_the_primary(self, allow_request):
+        cycle = MenstrualCycle.objects.create(user=self.user, menstruation_start=date(2024, 6, 1))
+        get_user_version(self.user.pk)
+        later = time.time() + settings.MENS1_REPLICA_PIN_SECONDS + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertEqual(
+                self.client.get(f'/api/menstrual-cycles/{cycle.pk}/', headers=self.headers).status_code, 404
+            )
+            response = self.client.patch(
+                f'/api/menstrual-cycles/{cycle.pk}/', {'menstruation_end': '2024-06-05'},
+                content_type='application/json', headers=self.headers,
+            )
+        self.assertEqual(response.status_code, 200)
+        cycle.refresh_from_db()
+        self.assertEqual(cycle.menstruation_end, date(2024, 6, 5))
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        get_cache().clear()
+        generate(1, cycles_per_user=4)
+        self.user = User.objects.get(username='synthetic-0')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+
+    def results(self, params=None):
+        response = self.client.get('/api/menstrual-cycles/', params or {}, headers=self.headers)
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_fields_and_exclude_shape_the_output(self, allow_request):
+        full = self.results()
+        self.assertEqual(len(full), 4)
+        sparse = self.results({'fields': 'id,menstruation_start'})
+        self.assertEqual([set(row) for row in sparse], [{'id', 'menstruation_start'}] * 4)
+        self.assertEqual(
+            self.results({'exclude': 'ovulation_date,user'}),
+            [{key: value for key, value in row.items() if key not in ('ovulation_date', 'user')} for row in full],
+        )
+
+    def test_only_requested_columns_are_selected(self, allow_request):
+        with CaptureQueriesContext(connection) as queries:
+            self.results({'fields': 'id'})
+        cycle_queries = [
+            query['sql'] for query in queries.captured_queries if 'FROM "Mens1_menstrualcycle"' in query['sql']
+        ]
+        self.assertEqual(len(cycle_queries), 1)
+        self.assertNotIn('"menstruation_end"', cycle_queries[0])
+        self.assertNotIn('"ovulation_date"', cycle_queries[0])
+
+    def test_fast_path_matches_the_serializer(self, allow_request):
+        for params in ({}, {'fields': 'id,menstruation_end'}, {'exclude': 'cycle_length'}):
+            with self.subTest(params=params):
+                self.assertEqual(self.results({**params, 'fast': 1}), self.results(params))
+
+
+class UserCacheTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        self.user = User.objects.create_user('cached', 'cached@example.com', DEFAULT_PASSWORD)
+        self.token = AccessToken.for_user(self.user)
+
+    def authenticate(self):
+        return CachedJWTAuthentication().get_user(self.token)
+
+    def test_hits_need_no_query_and_are_fresh_instances(self):
+        first = self.authenticate()
+        with self.assertNumQueries(0):
+            second = self.authenticate()
+        self.assertEqual(second.pk, self.user.pk)
+        self.assertIsNot(second, first)
+
+    def test_saving_or_deleting_the_user_invalidates(self):
+        self.authenticate()
+        self.user.is_active = False
+        self.user.save()
+        with self.assertRaisesMessage(AuthenticationFailed, 'User is inactive'):
+            self.authenticate()
+
+        self.user.delete()
+        with self.assertRaises(AuthenticationFailed):
+            self.authenticate()
+
+    def test_entries_expire(self):
+        cache = UserCache(ttl=10, max_entries=10)
+        cache.set(self.user.pk, self.user)
+        now = time.monotonic()
+        with mock.patch('time.monotonic', return_value=now + 9):
+            self.assertEqual(cache.get(self.user.pk).username, 'cached')
+        with mock.patch('time.monotonic', return_value=now + 11):
+            self.assertIsNone(cache.get(self.user.pk))
+
+
+class ThrottleTests(TestCase):
+    WINDOW_START = 60 * 1000  # Start of a one minute window, the user rate is 5/minute
+
+    def setUp(self):
+        user = User.objects.create_user('throttled', 'throttled@example.com', DEFAULT_PASSWORD)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(user)}"}
+
+    def get(self, path):
+        with mock.patch.object(SlidingWindowUserRateThrottle, 'timer', lambda throttle: self.clock):
+            return self.client.get(path, headers=self.headers)
+
+    def assertSlidingWindow(self, path):
+        caches['default'].clear()
+        ThrottleCounter.objects.all().delete()
+        self.clock = self.WINDOW_START
+        self.assertEqual([self.get(path).status_code for _ in range(6)], [200] * 5 + [429])
+
+        # Half way through the next window the previous one still weighs 5 * 0.5 requests
+        self.clock = self.WINDOW_START + 90
+        self.assertEqual([self.get(path).status_code for _ in range(2)], [200, 200])
+        throttled = self.get(path)
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(throttled['Retry-After'], '6')  # The previous window weighs 2 from 60% on
+
+        self.clock += 6
+        self.assertEqual(self.get(path).status_code, 200)
+        self.assertEqual(self.get(path).status_code, 429)
+
+    def test_sliding_window(self):
+        for store, path in [
+            ('database', '/api/menstrual-cycles/'), ('cache', '/api/menstrual-cycles/'),
+            ('database', '/api/async/menstrual-cycles/'), ('cache', '/api/async/menstrual-cycles/'),
+        ]:
+            with self.subTest(store=store, path=path), override_settings(
+                MENS1_THROTTLE_STORE=store, MENS1_THROTTLE_CACHE_ALIAS='default'
+            ):
+                self.assertSlidingWindow(path)
+
+    def test_warns_about_per_process_cache_store(self):
+        with override_settings(MENS1_THROTTLE_STORE='cache', MENS1_THROTTLE_CACHE_ALIAS='default'):
+            self.assertEqual([warning.id for warning in check_throttle_store(None)], ['Mens1.W001'])
+        with override_settings(MENS1_THROTTLE_STORE='database'):
+            self.assertEqual(check_throttle_store(None), [])
+
+
+class PredictionRefreshTests(TestCase):
+    def test_duplicates_update_the_newest_row(self):
+        generate(1, cycles_per_user=4)
+        user = User.objects.get(username='synthetic-0')
+        current = Prediction.objects.get(user=user)
+        newer = Prediction.objects.create(user=user, menstrual_cycle=current.menstrual_cycle)
+        Prediction.objects.filter(user=user).update(next_period_prediction=date(2000, 1, 1))
+
+        refresh_predictions(user.pk, user.pk + 1)
+
+        self.assertEqual(
+            Prediction.objects.get(pk=newer.pk).next_period_prediction, current.next_period_prediction
+        )
+        self.assertEqual(Prediction.objects.get(pk=current.pk).next_period_prediction, date(2000, 1, 1))
+
+
+class PredictionCacheTests(TestCase):
+    def setUp(self):
+        prediction_cache.clear()
+        generate(1, cycles_per_user=4)
+        self.user = User.objects.get(username='synthetic-0')
+
+    def test_hit_needs_no_query_and_writes_invalidate(self):
+        bundle = get_prediction_bundle(self.user.pk)
+        self.assertEqual(bundle['next_period'], Prediction.objects.get(user=self.user).next_period_prediction)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_prediction_bundle(self.user.pk), bundle)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            MenstrualCycle.objects.filter(user=self.user).first().save()
+        with self.assertNumQueries(2):
+            get_prediction_bundle(self.user.pk)
+        self.assertEqual(prediction_cache.metrics()['stale'], 1)
+
+    def test_lru_eviction_by_count_and_size(self):
+        cache = PredictionBundleCache(max_entries=2, max_bytes=10 ** 6)
+        for user_id in (1, 2, 3):
+            cache.set(user_id, 'v', {'next_period': None})
+        self.assertIsNone(cache.get(1, 'v'))
+        self.assertIsNotNone(cache.get(3, 'v'))
+        self.assertEqual(cache.metrics()['evictions'], 1)
+        self.assertEqual(cache.metrics()['hit_rate'], 0.5)
+
+        small = PredictionBundleCache(max_entries=100, max_bytes=1)
+        small.set(1, 'v', {'next_period': None})
+        self.assertEqual(small.metrics()['entries'], 0)
+
+
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+class ProfilingTests(TestCase):
+    def setUp(self):
+        user_cache.clear()
+        generate(1, cycles_per_user=4)
+        self.user = User.objects.get(username='synthetic-0')
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(lambda: [os.remove(os.path.join(self.directory, name)) for name in os.listdir(self.directory)])
+
+    def test_sampled_requests_are_dumped_and_rotated(self, allow_request):
+        with override_settings(MENS1_PROFILE_SAMPLE_RATE=1, MENS1_PROFILE_DIR=self.directory, MENS1_PROFILE_MAX_FILES=2):
+            for _ in range(3):
+                get_cache().clear()  # Profile the full view rather than a cached response
+                self.assertEqual(self.client.get('/api/menstrual-cycles/', headers=self.headers).status_code, 200)
+
+        self.assertEqual(len(os.listdir(self.directory)), 4)
+        [report] = hot_functions(self.directory, limit=5)
+        self.assertEqual(report['endpoint'], 'GET menstrual-cycle-list')
+        self.assertEqual(report['samples'], 2)
+        self.assertEqual(len(report['functions']), 5)
+        for phase in ('authentication', 'queryset', 'serialization', 'rendering'):
+            self.assertGreater(report['phases'][phase], 0)
+
+    def test_header_is_honoured_for_staff_only(self, allow_request):
+        with override_settings(MENS1_PROFILE_DIR=self.directory):
+            with mock.patch('Mens1.profiling.cProfile.Profile') as profile:
+                response = self.client.get('/api/menstrual-cycles/', headers={**self.headers, 'X-Mens1-Profile': '1'})
+                self.client.get('/api/menstrual-cycles/', headers={'X-Mens1-Profile': '1'})
+            profile.assert_not_called()
+            self.assertNotIn('X-Profile-Id', response)
+            self.assertEqual(os.listdir(self.directory), [])
+
+            User.objects.filter(pk=self.user.pk).update(is_staff=True)
+            user_cache.invalidate(self.user.pk)
+            response = self.client.get('/api/menstrual-cycles/', headers={**self.headers, 'X-Mens1-Profile': '1'})
+            self.assertIn(f"{response['X-Profile-Id']}.prof", os.listdir(self.directory))
+
+
+PERF_BASELINES_PATH = os.path.join(os.path.dirname(__file__), 'perf_baselines.json')
+PERF_SIZES = [(1, 4), (3, 12), (6, 36)]  # (users, cycles per user) seeded for the query count checks
+PERF_REPEATS = 5
+PERF_TOLERANCE = float(os.getenv('MENS1_PERF_TOLERANCE', 2.5))  # Allowed slowdown against the baseline
+PERF_SLACK_MS = 5.0  # Absolute allowance so sub-millisecond noise cannot fail a run
+
+
+def calibration_ms():
+    """Median time of a fixed CPU-bound workload, used to scale the timing baselines to this machine."""
+    timings = []
+    for _ in range(PERF_REPEATS):
+        start = time.perf_counter()
+        json.loads(json.dumps([{'day': day, 'values': sorted(range(day % 50, 0, -1))} for day in range(5000)]))
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+# Password hashing would dominate the auth endpoints' timings, hash cheaply like most test settings do
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.allow_request', return_value=True)
+@mock.patch('Mens1.throttling.SlidingWindowUserRateThrottle.aallow_request', return_value=True)
+class PerformanceBudgetTests(TestCase):
+    """
+    Query counts and timings of every endpoint, checked against perf_baselines.json.
+
+    Query counts must match the baseline exactly and must not change with the amount
+    of seeded data. Timings may exceed the baseline, scaled by calibration_ms(), by
+    PERF_TOLERANCE. After an intended change, rewrite the file with
+        MENS1_PERF_UPDATE_BASELINES=1 python manage.py test Mens1.tests.PerformanceBudgetTests
+    """
+
+    update_baselines = bool(os.getenv('MENS1_PERF_UPDATE_BASELINES'))
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        try:
+            with open(PERF_BASELINES_PATH) as baseline_file:
+                cls.baselines = json.load(baseline_file)
+        except FileNotFoundError:
+            cls.baselines = {'calibration_ms': None, 'endpoints': {}}
+
+    def save_baseline(self, name, **values):
+        self.baselines['endpoints'].setdefault(name, {}).update(values)
+        with open(PERF_BASELINES_PATH, 'w') as baseline_file:
+            json.dump(self.baselines, baseline_file, indent=2, sort_keys=True)
+            baseline_file.write('\n')
+
+    def baseline(self, name):
+        if name not in self.baselines['endpoints']:
+            self.fail(f"No baseline for {name}, run with MENS1_PERF_UPDATE_BASELINES=1 to record one.")
+        return self.baselines['endpoints'][name]
+
+    def seed(self, users, cycles_per_user):
+        generate(users, cycles_per_user=cycles_per_user, flow_log_cycles=2, prefix='perf-')
+        self.user = User.objects.get(username='perf-0')
+        self.staff = User.objects.create_user('perf-staff', 'staff@example.com', DEFAULT_PASSWORD, is_staff=True)
+        self.headers = {'Authorization': f"Bearer {AccessToken.for_user(self.user)}"}
+        self.staff_headers = {'Authorization': f"Bearer {AccessToken.for_user(self.staff)}"}
+        refresh_analytics(rebuild=True)
+
+    def request(self, method, path, body=None, headers=None):
+        def run():
+            return self.client.generic(
+                method, path, json.dumps(body) if body is not None else '',
+                content_type='application/json', headers=headers or {},
+            )
+        return run
+
+    def scenarios(self):
+        """Scenario name -> callable taking a repetition number and returning the callable to measure."""
+        user, headers, staff_headers = self.user, self.headers, self.staff_headers
+        cycles = MenstrualCycle.objects.filter(user=user).order_by('menstruation_start')
+        latest = cycles.last()
+        future = latest.menstruation_start + timedelta(days=400)
+        end = date.today()
+        calendar = f"?start={end - timedelta(days=89)}&end={end}"
+
+        def verify_email(i):
+            inactive = User.objects.create_user(f'perf-inactive-{i}', f'inactive-{i}@example.com', is_active=False)
+            token = jwt.encode(
+                {'user_id': inactive.pk, 'exp': timezone.now() + timedelta(hours=1)}, settings.SECRET_KEY, algorithm='HS256'
+            )
+            return self.request('GET', f'/api/verify-email/{token}/')
+
+        def create_history(i):
+            history = MenstrualCycleHistory(
+                user=user, related_cycle=latest, start_date=future + timedelta(days=40 * i),
+                end_date=future + timedelta(days=40 * i + 28), cycle_length=28,
+            )
+            return history.save
+
+        def save_profile(i):
+            profile = UserProfile.objects.get(user=user)
+            profile.bio = f'perf {i}'
+            return profile.save
+
+        return {
+            'token-obtain': lambda i: self.request(
+                'POST', '/api/token/', {'username': user.username, 'password': DEFAULT_PASSWORD}),
+            'token-refresh': lambda i: self.request(
+                'POST', '/api/token/refresh/', {'refresh': str(RefreshToken.for_user(user))}),
+            'register': lambda i: self.request('POST', '/api/register/', {
+                'username': f'perf-new-{i}', 'email': f'new-{i}@example.com', 'password': DEFAULT_PASSWORD}),
+            'verify-email': verify_email,
+            'api-root': lambda i: self.request('GET', '/api/', headers=headers),
+            'user-profile-list': lambda i: self.request('GET', '/api/user-profiles/', headers=headers),
+            'user-profile-detail': lambda i: self.request(
+                'GET', f'/api/user-profiles/{user.userprofile.pk}/', headers=headers),
+            'user-profile-update': lambda i: self.request(
+                'PATCH', f'/api/user-profiles/{user.userprofile.pk}/', {'bio': f'perf {i}'}, headers),
+            'menstrual-cycle-list': lambda i: self.request('GET', '/api/menstrual-cycles/', headers=headers),
+            'menstrual-cycle-detail': lambda i: self.request('GET', f'/api/menstrual-cycles/{latest.pk}/', headers=headers),
+            'menstrual-cycle-create': lambda i: self.request('POST', '/api/menstrual-cycles/', {
+                'user': user.pk, 'menstruation_start': str(future + timedelta(days=30 * i)),
+                'menstruation_end': str(future + timedelta(days=30 * i + 5))}, headers),
+            'menstrual-cycle-delete': lambda i: self.request(
+                'DELETE', f'/api/menstrual-cycles/{cycles.first().pk}/', headers=headers),
+            'flow-intensity-log-list': lambda i: self.request('GET', '/api/flow-intensity-logs/', headers=headers),
+            'flow-intensity-log-detail': lambda i: self.request(
+                'GET', f'/api/flow-intensity-logs/{FlowIntensityLog.objects.filter(user=user).first().pk}/', headers=headers),
+            'flow-intensity-log-batch': lambda i: self.request('POST', '/api/flow-intensity-logs/batch/', {'entries': [
+                {'cycle': latest.pk, 'date': str(future - timedelta(days=100 + 7 * i + day)), 'intensity': 'light'}
+                for day in range(7)
+            ]}, headers),
+            'menstrual-cycle-history-list': lambda i: self.request('GET', '/api/menstrual-cycle-history/', headers=headers),
+            'menstrual-cycle-history-detail': lambda i: self.request(
+                'GET', f'/api/menstrual-cycle-history/{MenstrualCycleHistory.objects.filter(user=user).first().pk}/',
+                headers=headers),
+            'prediction-list': lambda i: self.request('GET', '/api/predictions/', headers=headers),
+            'prediction-detail': lambda i: self.request(
+                'GET', f'/api/predictions/{Prediction.objects.filter(user=user).first().pk}/', headers=headers),
+            'prediction-next-period': lambda i: self.request('GET', '/api/predictions/next/', headers=headers),
+            'bulk-import': lambda i: self.request('POST', '/api/import/', {'cycles': [
+                {
+                    'menstruation_start': str(future + timedelta(days=1000 + 90 * i + 30 * n)),
+                    'menstruation_end': str(future + timedelta(days=1004 + 90 * i + 30 * n)),
+                    'flow_logs': [{'date': str(future + timedelta(days=1000 + 90 * i + 30 * n)), 'intensity': 'heavy'}],
+                }
+                for n in range(3)
+            ]}, headers),
+            'calendar': lambda i: self.request('GET', f'/api/calendar/{calendar}', headers=headers),
+            'export': lambda i: self.request('GET', '/api/export/cycles.csv', headers=headers),
+            'sync': lambda i: self.request('GET', '/api/sync/', headers=headers),
+            'analytics': lambda i: self.request('GET', '/api/analytics/', headers=staff_headers),
+            'cache-metrics': lambda i: self.request('GET', '/api/cache-metrics/', headers=staff_headers),
+            'async-menstrual-cycle-list': lambda i: self.request('GET', '/api/async/menstrual-cycles/', headers=headers),
+            'async-prediction-list': lambda i: self.request('GET', '/api/async/predictions/', headers=headers),
+            'async-user-profile': lambda i: self.request('GET', '/api/async/user-profile/', headers=headers),
+            'async-calendar': lambda i: self.request('GET', f'/api/async/calendar/{calendar}', headers=headers),
+            'UserProfile.save': save_profile,
+            'MenstrualCycleHistory.save': create_history,
+        }
+
+    def measure(self, name, run):
+        """Run one scenario with cold caches, returning its query count and duration in milliseconds."""
+        get_cache().clear()
+        user_cache.clear()
+        prediction_cache.clear()
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = run()
+            if response is not None:
+                content = b''.join(response.streaming_content) if response.streaming else response.content
+            elapsed = (time.perf_counter() - start) * 1000
+        if response is not None:
+            self.assertLess(response.status_code, 400, f"{name} failed: {content[:200]!r}")
+        return len(queries), elapsed
+
+    def test_query_counts_are_fixed_and_independent_of_data_size(self, aallow_request, allow_request):
+        counts = {}
+        for users, cycles_per_user in PERF_SIZES:
+            with transaction.atomic():
+                self.seed(users, cycles_per_user)
+                for name, prepare in self.scenarios().items():
+                    self.measure(name, prepare(0))  # Warm up per-process caches such as content types
+                    counts.setdefault(name, []).append(self.measure(name, prepare(1))[0])
+                transaction.set_rollback(True)
+
+        for name, sizes in counts.items():
+            with self.subTest(name):
+                self.assertEqual(len(set(sizes)), 1, f"{name} query count grows with data size: {sizes}")
+                if self.update_baselines:
+                    self.save_baseline(name, queries=sizes[0])
+                else:
+                    self.assertEqual(sizes[0], self.baseline(name)['queries'], f"{name} query count changed")
+
+    def test_timings_within_baseline(self, aallow_request, allow_request):
+        self.seed(*PERF_SIZES[-1])
+        calibration = calibration_ms()
+        scale = calibration / self.baselines['calibration_ms'] if self.baselines['calibration_ms'] else 1
+        if self.update_baselines:
+            self.baselines['calibration_ms'] = round(calibration, 3)
+
+        for name, prepare in self.scenarios().items():
+            self.measure(name, prepare(0))
+            median = statistics.median(self.measure(name, prepare(i))[1] for i in range(1, PERF_REPEATS + 1))
+            with self.subTest(name):
+                if self.update_baselines:
+                    self.save_baseline(name, ms=round(median, 3))
+                    continue
+                allowed = self.baseline(name)['ms'] * scale * PERF_TOLERANCE + PERF_SLACK_MS
+                self.assertLessEqual(
+                    median, allowed,
+                    f"{name} took {median:.1f} ms, over {allowed:.1f} ms "
+                    f"(baseline {self.baseline(name)['ms']:.1f} ms scaled by {scale:.2f})",
+                )
@@ -0,0 +1,164 @@
+"""
+Sliding-window-counter throttling with state shared across worker processes.
+
+Each client needs two counters, the current and the previous fixed window. The
+request rate is estimated as ``previous * (1 - elapsed) + current``, so every
+check is O(1) in time and memory, unlike DRF's list of request timestamps.
+Counters live in Redis when it is configured and in the database otherwise,
+see MENS1_THROTTLE_STORE.
+"""
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, transaction
+from django.db.models import Case, F, Value, When
+from rest_framework.throttling import UserRateThrottle
+from .models import ThrottleCounter
+
+
+class DatabaseThrottleStore:
+    """Counters in the ThrottleCounter table, updated with single atomic UPDATE statements."""
+
+    def roll(self, window):
+        """Update expressions moving the counters into ``window`` and counting one request."""
+        return {
+            'previous': Case(
+                When(window=window, then=F('previous')),
+                When(window=window - 1, then=F('current')),
+                default=Value(0),
+            ),
+            'current': Case(When(window=window, then=F('current') + 1), default=Value(1)),
+            'window': Value(window),
+        }
+
+    def hit(self, key, window, timeout):
+        roll = self.roll(window)
+        if not ThrottleCounter.objects.filter(key=key).update(**roll):
+            try:
+                with transaction.atomic():
+                    ThrottleCounter.objects.create(key=key, window=window, current=1, previous=0)
+                return 1, 0
+            except IntegrityError:
+                ThrottleCounter.objects.filter(key=key).update(**roll)  # Another worker created it first
+        return ThrottleCounter.objects.filter(key=key).values_list('current', 'previous').get()
+
+    def undo(self, key, window):
+        ThrottleCounter.objects.filter(key=key, window=window, current__gt=0).update(current=F('current') - 1)
+
+    async def ahit(self, key, window, timeout):
+        roll = self.roll(window)
+        if not await ThrottleCounter.objects.filter(key=key).aupdate(**roll):
+            try:
+                await ThrottleCounter.objects.acreate(key=key, window=window, current=1, previous=0)
+                return 1, 0
+            except IntegrityError:
+                await ThrottleCounter.objects.filter(key=key).aupdate(**roll)
+        return await ThrottleCounter.objects.filter(key=key).values_list('current', 'previous').aget()
+
+    async def aundo(self, key, window):
+        await ThrottleCounter.objects.filter(key=key, window=window, current__gt=0).aupdate(current=F('current') - 1)
+
+
+class CacheThrottleStore:
+    """
+    Counters in a Django cache, one key per client and window.
+
+    Increments are atomic on Redis and Memcached; with locmem the counters are
+    only shared inside one process, see the Mens1.W001 system check.
+    """
+
+    def __init__(self, alias):
+        self.cache = caches[alias]
+
+    def hit(self, key, window, timeout):
+        current_key = f'{key}:{window}'
+        self.cache.add(current_key, 0, timeout=timeout)
+        try:
+            current = self.cache.incr(current_key)
+        except ValueError:  # Expired between add and incr
+            self.cache.add(current_key, 1, timeout=timeout)
+            current = 1
+        return current, self.cache.get(f'{key}:{window - 1}', 0)
+
+    def undo(self, key, window):
+        try:
+            self.cache.decr(f'{key}:{window}')
+        except ValueError:
+            pass
+
+    async def ahit(self, key, window, timeout):
+        current_key = f'{key}:{window}'
+        await self.cache.aadd(current_key, 0, timeout=timeout)
+        try:
+            current = await self.cache.aincr(current_key)
+        except ValueError:
+            await self.cache.aadd(current_key, 1, timeout=timeout)
+            current = 1
+        return current, await self.cache.aget(f'{key}:{window - 1}', 0)
+
+    async def aundo(self, key, window):
+        try:
+            await self.cache.adecr(f'{key}:{window}')
+        except ValueError:
+            pass
+
+
+def get_throttle_store():
+    if settings.MENS1_THROTTLE_STORE == 'cache':
+        return CacheThrottleStore(settings.MENS1_THROTTLE_CACHE_ALIAS)
+    return DatabaseThrottleStore()
+
+
+class SlidingWindowUserRateThrottle(UserRateThrottle):
+    """UserRateThrottle backed by a shared sliding-window counter (see MENS1_THROTTLE_STORE)."""
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        window, elapsed = self.current_window()
+        store = get_throttle_store()
+        current, previous = store.hit(self.key, window, timeout=self.duration * 2)
+        if previous * (1 - elapsed) + current <= self.num_requests:
+            return True
+
+        store.undo(self.key, window)  # Rejected requests do not use up the allowance
+        self.wait_seconds = self.compute_wait(current - 1, previous, elapsed)
+        return False
+
+    async def aallow_request(self, request, view):
+        """Async variant of allow_request for the async views."""
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        window, elapsed = self.current_window()
+        store = get_throttle_store()
+        current, previous = await store.ahit(self.key, window, timeout=self.duration * 2)
+        if previous * (1 - elapsed) + current <= self.num_requests:
+            return True
+
+        await store.aundo(self.key, window)
+        self.wait_seconds = self.compute_wait(current - 1, previous, elapsed)
+        return False
+
+    def current_window(self):
+        """Return the index of the current window and the fraction of it that has elapsed."""
+        self.now = self.timer()
+        return int(self.now // self.duration), (self.now % self.duration) / self.duration
+
+    def compute_wait(self, current, previous, elapsed):
+        """Seconds until one more request fits under the estimated rate."""
+        if current + 1 > self.num_requests or not previous:
+            return (1 - elapsed) * self.duration
+        fits_at = 1 - (self.num_requests - current - 1) / previous
+        return max(fits_at - elapsed, 0) * self.duration
+
+    def wait(self):
+        return getattr(self, 'wait_seconds', None)
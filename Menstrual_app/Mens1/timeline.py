@@ -0,0 +1,87 @@
+"""
+Per-day calendar timeline for a date range.
+
+Rows are fetched with range-bounded queries on the (user, <date>) indexes and
+merged into the day list in a single pass. Fetching and building are separate
+so other read paths can reuse build_timeline with rows fetched another way.
+"""
+from datetime import timedelta
+from .models import MenstrualCycle, FlowIntensityLog, Prediction
+
+MAX_RANGE_DAYS = 366  # Longest range a single calendar request may cover
+MAX_CYCLE_SPAN_DAYS = 90  # Cycles starting earlier than this before the range are not considered
+PREDICTED_PERIOD_DAYS = 5  # Same default duration MenstrualCycle uses when no end date is given
+LUTEAL_PHASE_DAYS = 14
+
+CYCLE_FIELDS = ('id', 'menstruation_start', 'menstruation_end', 'ovulation_date',
+                'ovulation_window_start', 'ovulation_window_end')
+FLOW_LOG_FIELDS = ('date', 'intensity')
+PREDICTION_FIELDS = ('next_period_prediction', 'ovulation_prediction')
+
+
+def cycle_rows(user, start, end):
+    return MenstrualCycle.objects.filter(
+        user=user,
+        menstruation_start__gte=start - timedelta(days=MAX_CYCLE_SPAN_DAYS),
+        menstruation_start__lte=end,
+    ).order_by('menstruation_start').values(*CYCLE_FIELDS)
+
+
+def flow_log_rows(user, start, end):
+    return FlowIntensityLog.objects.filter(user=user, date__gte=start, date__lte=end).values(*FLOW_LOG_FIELDS)
+
+
+def prediction_rows(user, start, end):
+    # Predicted ovulation falls LUTEAL_PHASE_DAYS before the predicted period
+    return Prediction.objects.filter(
+        user=user,
+        next_period_prediction__gte=start - timedelta(days=PREDICTED_PERIOD_DAYS),
+        next_period_prediction__lte=end + timedelta(days=LUTEAL_PHASE_DAYS),
+    ).values(*PREDICTION_FIELDS)
+
+
+def fetch_timeline(user, start, end):
+    """Fetch the rows for a calendar range and build the timeline."""
+    return build_timeline(
+        start, end, cycle_rows(user, start, end), flow_log_rows(user, start, end), prediction_rows(user, start, end)
+    )
+
+
+def build_timeline(start, end, cycles, flow_logs, predictions):
+    """Assemble one entry per day between start and end (inclusive) from already fetched rows."""
+    days = [
+        {
+            'date': start + timedelta(days=offset),
+            'cycle': None,
+            'menstruation': False,
+            'flow_intensity': None,
+            'ovulation': False,
+            'fertile_window': False,
+            'predicted_period': False,
+            'predicted_ovulation': False,
+        }
+        for offset in range((end - start).days + 1)
+    ]
+
+    def mark(first, last, **values):
+        if first is None:
+            return
+        last = last or first
+        for offset in range(max((first - start).days, 0), min((last - start).days, len(days) - 1) + 1):
+            days[offset].update(values)
+
+    for cycle in cycles:
+        mark(cycle['menstruation_start'], cycle['menstruation_end'], menstruation=True, cycle=cycle['id'])
+        mark(cycle['ovulation_window_start'], cycle['ovulation_window_end'], fertile_window=True)
+        mark(cycle['ovulation_date'], cycle['ovulation_date'], ovulation=True)
+
+    for log in flow_logs:
+        mark(log['date'], log['date'], flow_intensity=log['intensity'])
+
+    for prediction in predictions:
+        period = prediction['next_period_prediction']
+        if period:
+            mark(period, period + timedelta(days=PREDICTED_PERIOD_DAYS - 1), predicted_period=True)
+        mark(prediction['ovulation_prediction'], prediction['ovulation_prediction'], predicted_ovulation=True)
+
+    return days
@@ -1,5 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from . import async_views
 from .views import (
     UserProfileViewSet,
     MenstrualCycleViewSet,
@@ -7,7 +8,13 @@ from .views import (
     FlowIntensityLogViewSet,
     PredictionViewSet,
     RegisterUserView,
-    VerifyEmailView
+    VerifyEmailView,
+    BulkImportView,
+    CalendarView,
+    ExportView,
+    SyncView,
+    AnalyticsView,
+    CacheMetricsView
 )
 
 router = DefaultRouter()
@@ -20,5 +27,15 @@ router.register('predictions', PredictionViewSet, basename='prediction')
 urlpatterns = [
     path('register/', RegisterUserView.as_view(), name='register'),
     path('verify-email/<str:token>/', VerifyEmailView.as_view(), name='verify-email'),
+    path('import/', BulkImportView.as_view(), name='bulk-import'),
+    path('calendar/', CalendarView.as_view(), name='calendar'),
+    path('export/<str:dataset>.<str:fmt>', ExportView.as_view(), name='export'),
+    path('sync/', SyncView.as_view(), name='sync'),
+    path('analytics/', AnalyticsView.as_view(), name='analytics'),
+    path('cache-metrics/', CacheMetricsView.as_view(), name='cache-metrics'),
+    path('async/menstrual-cycles/', async_views.menstrual_cycles, name='async-menstrual-cycle-list'),
+    path('async/predictions/', async_views.predictions, name='async-prediction-list'),
+    path('async/user-profile/', async_views.user_profile, name='async-user-profile'),
+    path('async/calendar/', async_views.calendar, name='async-calendar'),
     path('', include(router.urls)),  # Register all routes from the router
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
 from rest_framework import viewsets
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from .models import UserProfile, MenstrualCycle, FlowIntensityLog, Prediction, MenstrualCycleHistory
 from .serializers import UserProfileSerializer, MenstrualCycleSerializer, FlowIntensityLogSerializer, PredictionSerializer, MenstrualCycleHistorySerializer
@@ -6,12 +7,28 @@ from django.contrib.auth.models import User
 from rest_framework.response import Response
 from rest_framework.views import APIView
 from rest_framework import status
-from django.core.mail import send_mail
+from django.db import transaction
 from django.conf import settings
 import jwt
 from rest_framework.permissions import AllowAny
 import datetime
-from .serializers import UserRegistrationSerializer
+from .serializers import (
+    UserRegistrationSerializer, BulkImportSerializer, CalendarRangeSerializer, CalendarDaySerializer, FlowLogBatchSerializer
+)
+from .tasks import queue_email, trim_cycle_history
+from .caching import CachedResponseMixin
+from .fieldsets import SparseFieldsetViewMixin
+from .replicas import ReplicaReadMixin
+from .timeline import fetch_timeline
+from .exports import DATASETS, FORMATS, stream_export
+from .sync import SyncTokenError, SyncTokenExpired, changes_since
+from .analytics import STATE_KEY, histogram_report
+from .prediction_cache import get_prediction_bundle, prediction_cache
+from .models import AnalyticsState
+from rest_framework.permissions import IsAdminUser
+from .fieldsets import is_truthy
+from django.db import router
+from django.http import Http404, StreamingHttpResponse
 
 from .models import UserProfile, MenstrualCycle, FlowIntensityLog, MenstrualCycleHistory, Prediction
 from .serializers import (
@@ -25,80 +42,208 @@ from rest_framework.permissions import IsAuthenticated
 
 
 # ViewSet for UserProfile model
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
     serializer_class = UserProfileSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = '-id'
+    fast_fields = {
+        'id': 'id', 'user': 'user__username', 'birthdate': 'birthdate', 'bio': 'bio',
+        'next_menstruation_start': 'next_menstruation_start', 'menstruation_status': 'menstruation_status',
+        'safe_sex_zone': 'safe_sex_zone', 'cycle_state': 'cycle_state',
+    }
 
     def get_queryset(self):
-        return UserProfile.objects.filter(user=self.request.user)
+        return UserProfile.objects.filter(user=self.request.user).select_related('user')
 
 
 # ViewSet for MenstrualCycle model
-class MenstrualCycleViewSet(viewsets.ModelViewSet):
+class MenstrualCycleViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = MenstrualCycle.objects.all()
     serializer_class = MenstrualCycleSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-menstruation_start', '-id')
+    fast_fields = {
+        'id': 'id', 'user': 'user_id', 'menstruation_start': 'menstruation_start',
+        'menstruation_end': 'menstruation_end', 'cycle_length': 'cycle_length', 'ovulation_date': 'ovulation_date',
+    }
 
     def get_queryset(self):
         return MenstrualCycle.objects.filter(user=self.request.user)
 
 
 # ViewSet for FlowIntensityLog model
-class FlowIntensityLogViewSet(viewsets.ModelViewSet):
+class FlowIntensityLogViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = FlowIntensityLog.objects.all()
     serializer_class = FlowIntensityLogSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-date', '-id')
+    fast_fields = {'id': 'id', 'cycle': 'cycle_id', 'date': 'date', 'intensity': 'intensity'}
 
     def get_queryset(self):
         return FlowIntensityLog.objects.filter(user=self.request.user)
 
+    @action(detail=False, methods=['post'], url_path='batch')
+    def batch(self, request):
+        """Create or overwrite many daily logs in one request, see FlowLogBatchSerializer."""
+        serializer = FlowLogBatchSerializer(data=request.data, context={'request': request})
+        serializer.is_valid(raise_exception=True)
+        logs = serializer.save()
+        return Response({"upserted": len(logs), "results": [
+            {'id': log.pk, 'cycle': log.cycle_id, 'date': log.date, 'intensity': log.intensity} for log in logs
+        ]})
+
 
 # ViewSet for MenstrualCycleHistory model
-class MenstrualCycleHistoryViewSet(viewsets.ModelViewSet):
+class MenstrualCycleHistoryViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = MenstrualCycleHistory.objects.all()
     serializer_class = MenstrualCycleHistorySerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = ('-start_date', '-id')
 
     def get_queryset(self):
-        return MenstrualCycleHistory.objects.filter(user=self.request.user)
+        return MenstrualCycleHistory.objects.filter(user=self.request.user).prefetch_related('flow_logs')
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # Trimming to the history cap happens off the write path
+        user_ids = [serializer.instance.user_id]
+        transaction.on_commit(lambda: trim_cycle_history.delay(user_ids), robust=True)
 
 
 # ViewSet for Prediction model
-class PredictionViewSet(viewsets.ModelViewSet):
+class PredictionViewSet(ReplicaReadMixin, CachedResponseMixin, SparseFieldsetViewMixin, viewsets.ModelViewSet):
     queryset = Prediction.objects.all()
     serializer_class = PredictionSerializer
     permission_classes = [IsAuthenticated]
+    cursor_ordering = '-id'
+    fast_fields = {
+        'id': 'id', 'user': 'user_id', 'menstrual_cycle': 'menstrual_cycle_id',
+        'ovulation_prediction_accuracy': 'ovulation_prediction_accuracy',
+        'next_period_prediction': 'next_period_prediction', 'ovulation_prediction': 'ovulation_prediction',
+    }
 
     def get_queryset(self):
         return Prediction.objects.filter(user=self.request.user)
-    
+
+    @action(detail=False, methods=['get'], url_path='next')
+    def next_period(self, request):
+        """Next period, ovulation window, accuracy and cycle_state, served from the in-process bundle cache."""
+        return Response(get_prediction_bundle(request.user.pk))
+
+
+# Bulk import of cycles and flow logs in a single request
+class BulkImportView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = BulkImportSerializer(data=request.data, context={'request': request})
+        if serializer.is_valid():
+            imported = serializer.save()
+            return Response({"imported": imported}, status=status.HTTP_201_CREATED)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+# Calendar timeline for a date range, everything one month screen needs in one request
+class CalendarView(ReplicaReadMixin, CachedResponseMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        return self.cached_response(self.timeline, request)
+
+    def timeline(self, request):
+        serializer = CalendarRangeSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        start, end = serializer.validated_data['start'], serializer.validated_data['end']
+        days = fetch_timeline(request.user, start, end)
+        return Response({"start": start, "end": end, "days": CalendarDaySerializer(days, many=True).data})
+
+
+# Streams all of the user's rows of one dataset as CSV or NDJSON, e.g. export/cycles.csv?gzip=1
+class ExportView(ReplicaReadMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, dataset, fmt):
+        if dataset not in DATASETS or fmt not in FORMATS:
+            raise Http404
+
+        # The body is produced after the view returns, so resolve the database while routing state is set
+        using = router.db_for_read(DATASETS[dataset][0])
+        compress = is_truthy(request.query_params.get('gzip'))
+        filename = f"{dataset}.{fmt}" + ('.gz' if compress else '')
+
+        response = StreamingHttpResponse(
+            stream_export(dataset, fmt, user_id=request.user.pk, compress=compress, using=using),
+            content_type='application/gzip' if compress else FORMATS[fmt],
+        )
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+
+# Delta sync for offline clients: pass the previous response's "next" token as ?since=
+class SyncView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            payload = changes_since(request.user, request.query_params.get('since'), request=request)
+        except SyncTokenExpired as exc:
+            return Response({"since": [str(exc)]}, status=status.HTTP_410_GONE)
+        except SyncTokenError as exc:
+            return Response({"since": [str(exc)]}, status=status.HTTP_400_BAD_REQUEST)
+        response = Response(payload)
+        response['Cache-Control'] = 'private, no-store'
+        return response
+
+
+# Population histograms for staff dashboards, served from the pre-aggregated tables (see Mens1.analytics)
+class AnalyticsView(ReplicaReadMixin, APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        state = AnalyticsState.objects.filter(key=STATE_KEY).first()
+        return Response({
+            "updated_until": state.processed_until if state else None,
+            "metrics": histogram_report(request.query_params.get('metric'), request.query_params.get('age_group')),
+        })
+
+
+# Hit rate, size and evictions of this process's prediction bundle cache
+class CacheMetricsView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        return Response({"prediction_bundles": prediction_cache.metrics()})
+
 
 class RegisterUserView(APIView):
     permission_classes = [AllowAny]
     def post(self, request):
         serializer = UserRegistrationSerializer(data=request.data)
         if serializer.is_valid():
-            user = serializer.save()
-            
-            # Generate email confirmation token
-            token = jwt.encode(
-                {"user_id": user.id, "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=24)},
-                settings.SECRET_KEY,
-                algorithm="HS256"
-            )
-
-            # Email confirmation link
-            verification_link = f"http://127.0.0.1:8000/api/verify-email/{token}/"
-
-            # Send email
-            send_mail(
-                "Email Verification",
-                f"Click the link to verify your account: {verification_link}",
-                settings.EMAIL_HOST_USER,
-                [user.email],
-                fail_silently=False,
-            )
+            with transaction.atomic():
+                user = serializer.save()
+
+                # Generate email confirmation token
+                token = jwt.encode(
+                    {"user_id": user.id, "exp": datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=24)},
+                    settings.SECRET_KEY,
+                    algorithm="HS256"
+                )
+
+                # Email confirmation link
+                verification_link = f"http://127.0.0.1:8000/api/verify-email/{token}/"
+
+                # Queue the email, the Celery worker delivers it after the transaction commits
+                queue_email(
+                    "Email Verification",
+                    f"Click the link to verify your account: {verification_link}",
+                    settings.EMAIL_HOST_USER,
+                    user.email,
+                )
 
             return Response({"message": "User created. Check email for verification link."}, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
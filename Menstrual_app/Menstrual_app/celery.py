@@ -0,0 +1,17 @@
+"""
+Celery application for Menstrual_app.
+
+Start a worker with ``celery -A Menstrual_app worker`` and the scheduler with
+``celery -A Menstrual_app beat``. Settings prefixed with ``CELERY_`` in
+settings.py configure the app.
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'Menstrual_app.settings')
+
+app = Celery('Menstrual_app')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 from dotenv import load_dotenv
 import os
 from pathlib import Path
+from celery.schedules import crontab
 
 # Load environment variables from .env file
 load_dotenv()
@@ -53,6 +54,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Mens1.profiling.ProfilingMiddleware',  # First, so profiles cover the whole request
+    'Mens1.middleware.QueryBudgetMiddleware',
+    'Mens1.replicas.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -88,13 +92,110 @@ WSGI_APPLICATION = 'Menstrual_app.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Configured from the environment. DB_REPLICA_NAME (and DB_REPLICA_HOST for server databases)
+# adds a "replica" alias that serves read-only Mens1 API traffic, see Mens1.replicas.
+# Locally two SQLite files can stand in for primary and replica, e.g.
+#   sqlite3 db.sqlite3 ".backup replica.sqlite3" && DB_REPLICA_NAME=replica.sqlite3 python manage.py runserver
+
+DB_ENGINE = os.getenv('DB_ENGINE', 'django.db.backends.sqlite3')
+
+# WAL lets readers run alongside the writer; IMMEDIATE transactions take the write lock up front
+# instead of failing with "database is locked" when upgrading from a read.
+SQLITE_OPTIONS = {
+    'init_command': (
+        'PRAGMA journal_mode=WAL;'
+        'PRAGMA synchronous=NORMAL;'
+        'PRAGMA temp_store=MEMORY;'
+        'PRAGMA cache_size=-20000;'
+        'PRAGMA mmap_size=134217728;'
+    ),
+    'transaction_mode': 'IMMEDIATE',
+    'timeout': 5,  # Seconds to wait for a lock before raising
+}
+
+
+def database_settings(name, host=''):
+    config = {
+        'ENGINE': DB_ENGINE,
+        'NAME': name,
+        'CONN_MAX_AGE': int(os.getenv('DB_CONN_MAX_AGE', 60)),  # Use 0 when serving through ASGI
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if DB_ENGINE == 'django.db.backends.sqlite3':
+        config['OPTIONS'] = dict(SQLITE_OPTIONS)
+    else:
+        config.update({
+            'USER': os.getenv('DB_USER', ''),
+            'PASSWORD': os.getenv('DB_PASSWORD', ''),
+            'HOST': host,
+            'PORT': os.getenv('DB_PORT', ''),
+        })
+    return config
+
+
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+    'default': database_settings(os.getenv('DB_NAME', BASE_DIR / 'db.sqlite3'), os.getenv('DB_HOST', '')),
+}
+
+if os.getenv('DB_REPLICA_NAME') or os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = database_settings(
+        os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']), os.getenv('DB_REPLICA_HOST', '')
+    )
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['Mens1.replicas.PrimaryReplicaRouter']
+MENS1_REPLICA_PIN_SECONDS = int(os.getenv('MENS1_REPLICA_PIN_SECONDS', 5))  # Reads stay on the primary after a write
+
+
+# Caches
+# The "mens1" cache holds per-user API responses and the per-user data versions that invalidate
+# them (also read by the replica pin and the prediction bundle cache), so every worker process
+# must share it. It defaults to Redis when REDIS_URL is set; "database" (after
+# `manage.py createcachetable`) and "file" are shared too. The per-process "locmem" fallback is
+# only correct for a single process: other workers keep their own data versions, so after a
+# write they go on answering with the old ETags, 304s and prediction bundles, only response
+# bodies refresh once they expire (after a few seconds by default). Data versions never expire:
+# a new one changes ETags and Last-Modified and pins reads to the primary, just like a write.
+
+MENS1_CACHE_BACKENDS = {
+    'locmem': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'mens1',
+        'OPTIONS': {'MAX_ENTRIES': 10000},  # An evicted data version looks like a fresh write
+    },
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('MENS1_CACHE_LOCATION', str(BASE_DIR / 'cache')),
+    },
+    'database': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'mens1_cache',
+    },
+}
+
+if os.getenv('REDIS_URL'):
+    MENS1_CACHE_BACKENDS['redis'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
     }
+
+MENS1_CACHE_BACKEND = os.getenv('MENS1_CACHE_BACKEND', 'redis' if os.getenv('REDIS_URL') else 'locmem')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'mens1': MENS1_CACHE_BACKENDS[MENS1_CACHE_BACKEND],
 }
 
+if os.getenv('REDIS_URL'):
+    CACHES['redis'] = MENS1_CACHE_BACKENDS['redis']
+
+MENS1_CACHE_ALIAS = 'mens1'
+MENS1_CACHE_TIMEOUT = int(os.getenv(  # Seconds a cached response is kept
+    'MENS1_CACHE_TIMEOUT', 5 if MENS1_CACHE_BACKEND == 'locmem' else 60 * 60
+))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -147,21 +248,114 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',  # Default permission class
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',  # Using JWT for token-based auth
+        'Mens1.authentication.CachedJWTAuthentication',  # JWT auth with an in-process user cache
     ],
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
     ],
     'DEFAULT_RENDERER_CLASSES': [
-        'rest_framework.renderers.JSONRenderer',
+        'Mens1.renderers.FastJSONRenderer',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'Mens1.pagination.DateCursorPagination',
+    'PAGE_SIZE': 50,
     'DEFAULT_THROTTLE_CLASSES': [
-        'rest_framework.throttling.UserRateThrottle',
+        'Mens1.throttling.SlidingWindowUserRateThrottle',  # Shared across workers, see MENS1_THROTTLE_STORE
     ],
     'DEFAULT_THROTTLE_RATES': {
-        'user': '5/minute',
+        'user': os.getenv('MENS1_THROTTLE_USER_RATE', '5/minute'),
     }
 }
 
 CSRF_TRUSTED_ORIGINS = ['http://localhost:8000']
-EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
\ No newline at end of file
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+
+# Celery
+# Without a broker configured, tasks run eagerly in-process so local setups work with the console email backend.
+# Queued emails are then not sent from the request, run `manage.py send_outbound_emails` (e.g. from cron).
+
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'memory://')
+CELERY_TASK_ALWAYS_EAGER = os.getenv(
+    'CELERY_TASK_ALWAYS_EAGER', 'True' if CELERY_BROKER_URL == 'memory://' else 'False'
+) == 'True'
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_BEAT_SCHEDULE = {
+    'deliver-outbound-emails': {
+        'task': 'Mens1.tasks.deliver_outbound_emails',
+        'schedule': 60.0,  # Pick up anything left pending by failed or skipped deliveries
+    },
+    'purge-old-flow-logs': {
+        'task': 'Mens1.tasks.purge_old_flow_logs',
+        'schedule': 60.0 * 60,
+    },
+    'trim-cycle-history': {
+        'task': 'Mens1.tasks.trim_cycle_history',
+        'schedule': 60.0 * 60,  # Catches rows written without going through the API
+    },
+    'refresh-all-predictions': {
+        'task': 'Mens1.tasks.refresh_all_predictions',
+        'schedule': 60.0 * 60 * 24,
+    },
+    'purge-tombstones': {
+        'task': 'Mens1.tasks.purge_tombstones',
+        'schedule': 60.0 * 60 * 24,
+    },
+    'refresh-population-analytics': {
+        'task': 'Mens1.tasks.refresh_population_analytics',
+        'schedule': 60.0 * 15,
+    },
+    'refresh-all-profiles': {
+        'task': 'Mens1.tasks.refresh_all_profiles',
+        'schedule': crontab(hour=0, minute=5),  # Menstruation status and safe sex zone change with the date
+    },
+}
+
+# Outbound email delivery
+OUTBOUND_EMAIL_BATCH_SIZE = int(os.getenv('OUTBOUND_EMAIL_BATCH_SIZE', 100))
+OUTBOUND_EMAIL_MAX_ATTEMPTS = int(os.getenv('OUTBOUND_EMAIL_MAX_ATTEMPTS', 5))
+
+# Data retention
+FLOW_LOG_RETENTION_DAYS = int(os.getenv('FLOW_LOG_RETENTION_DAYS', 90))
+RETENTION_BATCH_SIZE = int(os.getenv('RETENTION_BATCH_SIZE', 1000))
+RETENTION_BATCH_PAUSE = float(os.getenv('RETENTION_BATCH_PAUSE', 0.05))  # Seconds between batches
+
+# Query budgets per URL name, checked by Mens1.middleware.QueryBudgetMiddleware
+MENS1_QUERY_BUDGET_DEFAULT = int(os.getenv('MENS1_QUERY_BUDGET_DEFAULT', 20))
+MENS1_QUERY_BUDGET_MODE = os.getenv('MENS1_QUERY_BUDGET_MODE', 'warn')  # "warn" or "raise"
+MENS1_QUERY_BUDGETS = {
+    'GET menstrual-cycle-list': 5,
+    'GET flow-intensity-log-list': 5,
+    'GET menstrual-cycle-history-list': 6,
+    'GET prediction-list': 5,
+    'GET user-profile-list': 5,
+    'GET calendar': 6,
+    'GET sync': 12,
+    'GET analytics': 6,
+    'GET prediction-next-period': 5,
+}
+
+# Delta sync, see Mens1.sync
+MENS1_SYNC_PAGE_SIZE = int(os.getenv('MENS1_SYNC_PAGE_SIZE', 500))  # Changed rows per model and response
+MENS1_SYNC_SETTLE_SECONDS = int(os.getenv('MENS1_SYNC_SETTLE_SECONDS', 2))  # Rows younger than this wait for the next sync
+MENS1_TOMBSTONE_RETENTION_DAYS = int(os.getenv('MENS1_TOMBSTONE_RETENTION_DAYS', 30))  # Also the sync token lifetime
+
+# In-process cache of authenticated users, see Mens1.authentication
+MENS1_AUTH_USER_CACHE_TTL = int(os.getenv('MENS1_AUTH_USER_CACHE_TTL', 30))  # Seconds, 0 disables the cache
+MENS1_AUTH_USER_CACHE_SIZE = int(os.getenv('MENS1_AUTH_USER_CACHE_SIZE', 10000))
+
+# In-process LRU cache of prediction bundles, see Mens1.prediction_cache
+MENS1_PREDICTION_CACHE_SIZE = int(os.getenv('MENS1_PREDICTION_CACHE_SIZE', 50000))  # Entries, 0 disables the cache
+MENS1_PREDICTION_CACHE_MAX_BYTES = int(os.getenv('MENS1_PREDICTION_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+
+# Request profiling, see Mens1.profiling. Dumps are summarized with `manage.py profile_report`.
+MENS1_PROFILE_SAMPLE_RATE = float(os.getenv('MENS1_PROFILE_SAMPLE_RATE', 0))  # Share of requests profiled, 0 disables sampling
+MENS1_PROFILE_HEADER = os.getenv('MENS1_PROFILE_HEADER', 'X-Mens1-Profile')  # Profiles the request when sent by a staff user
+MENS1_PROFILE_DIR = os.getenv('MENS1_PROFILE_DIR', str(BASE_DIR / 'profiles'))
+MENS1_PROFILE_MAX_FILES = int(os.getenv('MENS1_PROFILE_MAX_FILES', 500))  # Older dumps are deleted
+
+# Throttle state shared by every worker: "cache" keeps the counters in MENS1_THROTTLE_CACHE_ALIAS,
+# which needs a shared backend with atomic incr (Redis, the default when REDIS_URL is set).
+# Without it the counters go to the ThrottleCounter table ("database"), which writes on every
+# request, under SQLite each GET then briefly holds the database lock. A per-process locmem alias
+# would let every worker allow the full rate, the Mens1.W001 system check warns about it.
+MENS1_THROTTLE_STORE = os.getenv('MENS1_THROTTLE_STORE', 'cache' if os.getenv('REDIS_URL') else 'database')
+MENS1_THROTTLE_CACHE_ALIAS = os.getenv('MENS1_THROTTLE_CACHE_ALIAS', 'redis' if os.getenv('REDIS_URL') else 'default')